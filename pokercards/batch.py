@@ -0,0 +1,107 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.batch` -- Vectorized hand evaluation
+=====================================================
+
+Evaluate large arrays of hands at once with NumPy, using the lookup
+tables of :class:`pokercards.evaluator.TableEvaluator`. Requires NumPy.
+
+Cards are given by their :attr:`pokercards.cards.Card.id` and the
+resulting strengths are the same integers as
+:attr:`pokercards.cards.PokerHand.strength`.
+"""
+
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from evaluator import table_evaluator, RANK_SHIFT
+
+# NumPy tables of each evaluator, dropped with the evaluator
+_arrays = weakref.WeakKeyDictionary()
+
+def _tables(evaluator):
+    """NumPy copies of the evaluator tables, built once per evaluator."""
+    try:
+        return _arrays[evaluator]
+    except KeyError:
+        pass
+    evaluator.build()
+    items = sorted(evaluator._nonflush.items())
+    tables = (
+        numpy.array([k for k, v in items], dtype=numpy.int64),
+        numpy.array([v for k, v in items], dtype=numpy.int32),
+        numpy.array(evaluator._flush, dtype=numpy.int32),
+        numpy.array(evaluator._quinary, dtype=numpy.int64),
+        numpy.array(evaluator._bits, dtype=numpy.int32),
+        numpy.arange(len(evaluator._bits), dtype=numpy.int8) // 13,
+        numpy.array(evaluator.hand_ranks, dtype=numpy.int32),
+        )
+    _arrays[evaluator] = tables
+    return tables
+
+def evaluate_batch(ids, evaluator=None, chunk_size=1 << 20):
+    """Evaluate an array of hands.
+
+    :param ids: Array of shape (N, 5), (N, 6) or (N, 7) with card ids,
+       one hand per row. Rows must not hold the same card twice.
+    :param evaluator: :class:`pokercards.evaluator.TableEvaluator`
+       to take the tables from, the shared one by default.
+    :param chunk_size: Number of rows evaluated at once, bounding the
+       size of temporary arrays.
+    :returns: Tuple of int32 arrays (strength, hand rank) of length N.
+    :raises: ImportError, ValueError also for repeated cards and cards
+       not in the deck of the evaluator
+    """
+    if numpy is None:
+        raise ImportError('evaluate_batch(): NumPy is required')
+    if evaluator is None:
+        evaluator = table_evaluator
+    ids = numpy.asarray(ids)
+    if ids.ndim != 2 or not 5 <= ids.shape[1] <= 7:
+        raise ValueError('evaluate_batch(): expected array of shape (N, 5..7)')
+    if ids.size and (ids.min() < 0 or ids.max() > 51):
+        raise ValueError('evaluate_batch(): invalid card id')
+    keys, values, flush, quinary, bits, suit_of, hand_ranks = _tables(evaluator)
+
+    strength = numpy.empty(len(ids), dtype=numpy.int32)
+    for start in xrange(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size].astype(numpy.intp)
+        ordered = numpy.sort(chunk, axis=1)
+        if (ordered[:, 1:] == ordered[:, :-1]).any():
+            raise ValueError('evaluate_batch(): card repeated in a hand')
+        key = quinary[chunk].sum(axis=1)
+        index = numpy.minimum(numpy.searchsorted(keys, key), len(keys) - 1)
+        if (keys[index] != key).any():
+            raise ValueError('evaluate_batch(): hand not in the tables of the evaluator')
+        best = values[index]
+        card_bits = bits[chunk]
+        card_suits = suit_of[chunk]
+        for suit in xrange(4):
+            mask = numpy.where(card_suits == suit, card_bits, 0).sum(axis=1)
+            numpy.maximum(best, flush[mask], out=best)
+        strength[start:start + chunk_size] = best
+    return strength, hand_ranks[strength >> RANK_SHIFT]
@@ -0,0 +1,276 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.bench` -- Benchmarks
+=====================================
+
+Measure throughput of the hot paths of :mod:`pokercards.cards`. Run as::
+
+    python -m pokercards.bench [-o results.json] [-c baseline.json]
+
+Results are printed as JSON. With ``-c`` the results are compared to
+a previously saved run and the command exits with status 1 if any
+benchmark got slower (or used more memory) by more than the threshold.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from const import __version__
+from cards import Card, CardSet, Deck, FastDeck, PokerHand, HandRecordArray
+from evaluator import table_evaluator, warm_up
+
+#: registered benchmarks, list of (name, function, unit, higher is better)
+benchmarks = []
+
+def benchmark(unit='ops/s', higher_is_better=True):
+    def register(func):
+        benchmarks.append((func.__name__, func, unit, higher_is_better))
+        return func
+    return register
+
+def _rate(func, count, repeat):
+    """Best rate of ``count`` operations done by ``func()`` in ops/s."""
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        func()
+        elapsed = max(time.time() - start, 1e-9)
+        if best is None or elapsed < best:
+            best = elapsed
+    return count / best
+
+def _samples(size, count, seed=0):
+    rng = random.Random(seed)
+    deck = list(Card._by_id)
+    return [rng.sample(deck, size) for i in xrange(count)]
+
+def _hands(size, scale, repeat):
+    samples = _samples(size, 1000 * scale)
+    def run():
+        for cards in samples:
+            PokerHand(cards)
+    return _rate(run, len(samples), repeat)
+
+@benchmark()
+def hand_5(scale, repeat):
+    return _hands(5, scale, repeat)
+
+@benchmark()
+def hand_6(scale, repeat):
+    return _hands(6, scale, repeat)
+
+@benchmark()
+def hand_7(scale, repeat):
+    return _hands(7, scale, repeat)
+
+@benchmark()
+def evaluate_mask_7(scale, repeat):
+    masks = [CardSet(cards).mask for cards in _samples(7, 1000 * scale)]
+    evaluate = table_evaluator.evaluate_mask
+    def run():
+        for mask in masks:
+            evaluate(mask)
+    return _rate(run, len(masks), repeat)
+
+@benchmark()
+def card_sort(scale, repeat):
+    samples = _samples(7, 1000 * scale)
+    def run():
+        for cards in samples:
+            sorted(cards, reverse=True)
+    return _rate(run, len(samples), repeat)
+
+@benchmark()
+def hand_sort(scale, repeat):
+    hands = [PokerHand(cards) for cards in _samples(7, 1000 * scale)]
+    def run():
+        sorted(hands, reverse=True)
+    return _rate(run, len(hands), repeat)
+
+@benchmark()
+def deck_cycle(scale, repeat):
+    count = 200 * scale
+    def run():
+        deck = Deck()
+        for i in xrange(count):
+            deck.shuffle()
+            for j in xrange(9):
+                deck.pop()
+            deck.discard()
+            deck.return_all()
+    return _rate(run, count, repeat)
+
+@benchmark()
+def fastdeck_cycle(scale, repeat):
+    count = 2000 * scale
+    deck = FastDeck(seed=0)
+    def run():
+        for i in xrange(count):
+            deck.reset()
+            deck.deal(9)
+    return _rate(run, count, repeat)
+
+def _store_hands(hands):
+    return [PokerHand(cards) for cards in hands]
+
+def _measure_memory(store, scale):
+    samples = _samples(7, 1000)
+    count = 20000 * scale
+    table_evaluator.build()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    hands = store(samples[i % 1000] for i in xrange(count))
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    del hands
+    # ru_maxrss is in kilobytes on Linux, bytes on Mac OS X
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return (after - before) * unit * 1000000.0 / count
+
+def _memory_1m(store, scale):
+    """Peak memory growth per million 7-card hands kept by ``store``,
+    measured in a fresh worker process so earlier peaks do not hide it."""
+    if resource is None:
+        return None
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(_measure_memory, (store, scale))
+    finally:
+        pool.terminate()
+        pool.join()
+
+@benchmark(unit='bytes', higher_is_better=False)
+def hand_memory_1m(scale, repeat):
+    """Peak memory growth per million stored 7-card hands."""
+    return _memory_1m(_store_hands, scale)
+
+@benchmark(unit='bytes', higher_is_better=False)
+def record_memory_1m(scale, repeat):
+    """Peak memory growth per million 7-card hands in a record array."""
+    return _memory_1m(HandRecordArray, scale)
+
+# run in a fresh interpreter, prints seconds taken by the import
+_IMPORT_SCRIPT = '''import time
+start = time.time()
+import pokercards.cards
+print(time.time() - start)
+'''
+
+@benchmark(unit='ms', higher_is_better=False)
+def import_cards(scale, repeat):
+    """Time to import :mod:`pokercards.cards` in a new process."""
+    # the package imported by the new process is this one
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [root, env.get('PYTHONPATH')]))
+    return min(float(subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT],
+            env=env)) for i in xrange(repeat)) * 1000
+
+def run(names=None, scale=1, repeat=3):
+    """Run benchmarks and return the results as a dict."""
+    # build the tables first so no benchmark is charged for it
+    warm_up()
+    results = {}
+    for name, func, unit, higher_is_better in benchmarks:
+        if names and name not in names:
+            continue
+        results[name] = {
+            'value': func(scale, repeat),
+            'unit': unit,
+            'higher_is_better': higher_is_better,
+            }
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'time': time.time(),
+        'results': results,
+        }
+
+def compare(current, baseline, threshold=0.1):
+    """Compare results to baseline.
+
+    :returns: List of names of benchmarks which regressed by more than
+       ``threshold`` (relative).
+    """
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None or not base['value'] or result['value'] is None:
+            continue
+        ratio = float(result['value']) / base['value']
+        result['baseline'] = base['value']
+        result['ratio'] = ratio
+        if result['higher_is_better']:
+            regressed = ratio < 1 - threshold
+        else:
+            regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(name)
+    current['regressions'] = regressions
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pokercards.bench',
+            description='Benchmark pokercards hot paths.')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default all)')
+    parser.add_argument('-o', '--output', help='save results to file')
+    parser.add_argument('-c', '--compare', metavar='BASELINE',
+            help='compare to results saved earlier')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+            help='relative change reported as regression (default 0.1)')
+    parser.add_argument('-s', '--scale', type=int, default=1,
+            help='multiply the amount of work')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+            help='repetitions, best one counts')
+    parser.add_argument('-l', '--list', action='store_true',
+            help='list benchmarks and exit')
+    args = parser.parse_args(argv)
+    if args.list:
+        for name, func, unit, higher_is_better in benchmarks:
+            print(name)
+        return 0
+
+    results = run(args.names, args.scale, args.repeat)
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
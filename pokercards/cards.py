@@ -26,12 +26,37 @@
 
 import random
 import logging
+from array import array
 from collections import OrderedDict
 
 from const import __version__, suits, ranks, POS_TOP, POS_BOTTOM
+import evaluator
+from evaluator import RANK_SHIFT
 
 logger = logging.getLogger(__name__)
 
+#: logger of hand evaluation trace events, see :func:`update_trace`
+trace_logger = logging.getLogger(__name__ + '.trace')
+_trace = False
+
+def update_trace():
+    """Enable or disable hand evaluation trace according to the level
+    of :data:`trace_logger`.
+
+    Evaluation checks a flag set by this function instead of asking
+    the logger, so the trace costs nothing when disabled. Call it after
+    changing the logging configuration, or use
+    :func:`pokercards.logsetup.enable_trace`.
+
+    When enabled, every evaluated :class:`PokerHand` emits a debug
+    record with a ``trace`` attribute holding a dict with keys
+    ``cards``, ``strength``, ``hand_rank``, ``hand_cards`` and
+    ``kickers``.
+    """
+    global _trace
+    _trace = trace_logger.isEnabledFor(logging.DEBUG)
+    return _trace
+
 def f_list(lst, sep=','):
     return sep.join([str(x) for x in lst])
 
@@ -45,6 +70,10 @@ class Card(object):
     a card of the same rank but different suit, is compared as neither
     higher, lower nor equal.
 
+    There is only one instance of each of the 52 cards, creating a card
+    returns the shared instance. Cards are immutable and equal only
+    to themselves.
+
     :param rank: Either the rank (one of 'A', 'K', 'Q', 'J', 'T', '9', ... '2')
        or rank and suit together (e.g. 'AS', '8H', etc.)
     :type rank: str
@@ -52,18 +81,72 @@ class Card(object):
        (one of 'S', 'H', 'C', 'D' for spade, heart, club or diamond)
     :type suit: str
     :raises: ValueError
+
+    .. attribute:: id
+
+       Number of the card from 0 to 51, in the order of a new deck.
+
+    .. attribute:: rank_value
+
+       Rank of the card as number, 0 for deuce up to 12 for ace.
+
+    .. attribute:: suit_index
+
+       Index of the suit in :data:`pokercards.const.suits`.
+
+    .. attribute:: suit_bit
+
+       Suit as a bit flag, ``1 << suit_index``.
+
+    .. attribute:: mask
+
+       Bit of the card in a :class:`pokercards.cards.CardSet` mask,
+       ``1 << (16 * suit_index + rank_value)``.
     """
 
-    def __init__(self, rank, suit=None):
-        if suit is None:
-            suit = rank[1]
-            rank = rank[0]
-        if rank not in ranks:
+    __slots__ = ('rank', 'suit', 'id', 'rank_value', 'suit_index', 'suit_bit',
+            'mask')
+
+    _interned = {}
+    _by_id = []
+    _by_bit = [None] * 64
+
+    def __new__(cls, rank, suit=None):
+        if suit is not None:
+            rank = rank + suit
+        try:
+            return cls._interned[rank]
+        except (KeyError, TypeError):
+            pass
+        if rank[0:1] not in ranks:
             raise ValueError('Card(): Invalid rank')
-        if suit not in suits:
-            raise ValueError('Card(): Invalid suit')
-        self.rank = rank
-        self.suit = suit
+        raise ValueError('Card(): Invalid suit')
+
+    @classmethod
+    def _intern(cls):
+        for suit_index, suit in enumerate(suits):
+            for rank_index, rank in enumerate(ranks):
+                card = object.__new__(cls)
+                for name, value in (
+                        ('rank', rank),
+                        ('suit', suit),
+                        ('id', len(cls._by_id)),
+                        ('rank_value', len(ranks) - 1 - rank_index),
+                        ('suit_index', suit_index),
+                        ('suit_bit', 1 << suit_index),
+                        ('mask', 1 << (16 * suit_index + len(ranks) - 1 - rank_index))):
+                    object.__setattr__(card, name, value)
+                cls._interned[rank + suit] = card
+                cls._by_id.append(card)
+                cls._by_bit[card.mask.bit_length() - 1] = card
+
+    @classmethod
+    def from_id(cls, card_id):
+        """Get the card with given :attr:`id`.
+
+        :raises: IndexError
+        """
+        return cls._by_id[card_id]
 
     @classmethod
     def card_list(cls, *args):
@@ -77,10 +160,22 @@ class Card(object):
         :rtype: list of :class:`pokercards.cards.Card` objects
         :raises: ValueError
         """
-        lst = []
-        for c in args:
-            lst.append(cls(c))
-        return lst
+        return [cls(c) for c in args]
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Card objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Card objects are immutable')
+
+    def __reduce__(self):
+        return (Card, (self.rank + self.suit,))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __str__(self):
         return self.rank + self.suit
@@ -89,44 +184,175 @@ class Card(object):
         return 'Card(%s, %s)' % (self.rank, self.suit)
 
     def __hash__(self):
-        return (ord(self.rank) << 8) + ord(self.suit)
+        return self.id
 
     def __eq__(self, obj):
-        return self.rank == obj.rank and self.suit == obj.suit
+        return self is obj
 
     def __ne__(self, obj):
-        return self.rank != obj.rank or self.suit != obj.suit
+        return self is not obj
 
     def __lt__(self, obj):
-        return ranks.index(self.rank) > ranks.index(obj.rank)
+        return self.rank_value < obj.rank_value
 
     def __gt__(self, obj):
-        return ranks.index(self.rank) < ranks.index(obj.rank)
+        return self.rank_value > obj.rank_value
 
     def __le__(self, obj):
-        return ranks.index(self.rank) >= ranks.index(obj.rank)
+        return self.rank_value <= obj.rank_value
 
     def __ge__(self, obj):
-        return ranks.index(self.rank) <= ranks.index(obj.rank)
+        return self.rank_value >= obj.rank_value
+
+Card._intern()
+
+class CardSet(object):
+    """Immutable set of cards represented by a single integer bitmask.
+
+    Each card occupies the bit given by its :attr:`Card.mask`, so set
+    operations and membership tests are single integer operations.
+    Card sets support ``|``, ``&``, ``-`` and ``^`` with other card
+    sets, ``in``, ``len()`` and iteration, which yields the cards
+    ordered by suit and rank.
+
+    :param cards: Iterable of :class:`pokercards.cards.Card` objects
+       or another card set.
+    """
+
+    __slots__ = ('mask',)
+
+    def __init__(self, cards=None):
+        mask = 0
+        if isinstance(cards, CardSet):
+            mask = cards.mask
+        elif cards is not None:
+            for card in cards:
+                mask |= card.mask
+        object.__setattr__(self, 'mask', mask)
+
+    @classmethod
+    def from_mask(cls, mask):
+        """Create a card set from an integer bitmask."""
+        cardset = cls.__new__(cls)
+        object.__setattr__(cardset, 'mask', mask)
+        return cardset
+
+    def to_list(self):
+        """Return list of the cards in the set."""
+        return list(self)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CardSet objects are immutable')
+
+    def __reduce__(self):
+        return (CardSet.from_mask, (self.mask,))
+
+    def __iter__(self):
+        by_bit = Card._by_bit
+        mask = self.mask
+        while mask:
+            low = mask & -mask
+            yield by_bit[low.bit_length() - 1]
+            mask ^= low
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def __nonzero__(self):
+        return self.mask != 0
+
+    __bool__ = __nonzero__
+
+    def __contains__(self, card):
+        return self.mask & card.mask != 0
+
+    def __or__(self, other):
+        return CardSet.from_mask(self.mask | other.mask)
+
+    def __and__(self, other):
+        return CardSet.from_mask(self.mask & other.mask)
+
+    def __sub__(self, other):
+        return CardSet.from_mask(self.mask & ~other.mask)
+
+    def __xor__(self, other):
+        return CardSet.from_mask(self.mask ^ other.mask)
+
+    def __eq__(self, other):
+        return isinstance(other, CardSet) and self.mask == other.mask
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __str__(self):
+        return '[%s]' % f_list(self)
+
+    def __repr__(self):
+        return 'CardSet(%s)' % self.__str__()
 
 class Deck(object):
-    """Represents a single deck of 52 :class:`card.Card` objects.
+    """Represents a single deck of 52 :class:`card.Card` objects, or of
+    the cards of a variant.
 
     The deck could be imagined face down on a table. All internal lists
     represent the cards in order from bottom up. So dealing the top
     card means poping last item from the list.
+
+    :param dead: Cards left out of the deck, e.g. cards known to be
+       held elsewhere.
+    :type dead: :class:`pokercards.cards.CardSet` or list of
+       :class:`pokercards.cards.Card` objects
+    :param rng: Random generator used for shuffling, the global one
+       of :mod:`random` module by default.
+    :type rng: :class:`random.Random`
+    :param variant: :class:`pokercards.variants.Variant` whose deck to
+       use, cards not in it are dead.
     """
-    def __init__(self):
+    def __init__(self, dead=None, rng=None, variant=None):
+        self.rng = rng if rng is not None else random
         self.popped = []
         self.discarded = []
-        self.active = []
-        for s in suits:
-            for r in ranks:
-                self.active.append(Card(r, s))
+        self.dead = CardSet(dead)
+        if variant is not None:
+            self.dead |= variant.dead
+        self._popped = 0
+        self._discarded = 0
+        if self.dead:
+            dead_mask = self.dead.mask
+            self.active = [c for c in Card._by_id if not c.mask & dead_mask]
+        else:
+            self.active = list(Card._by_id)
 
     def shuffle(self):
-        """Shuffle the deck."""
-        random.shuffle(self.active)
+        """Shuffle the deck.
+
+        :returns: Record of the new order, see :meth:`record`.
+        """
+        self.rng.shuffle(self.active)
+        return self.record()
+
+    def record(self):
+        """Record the order of the cards in the deck compactly.
+
+        :returns: String of card ids, one byte for each active card
+           from the bottom up.
+        """
+        return bytes(bytearray([card.id for card in self.active]))
+
+    @classmethod
+    def from_record(cls, record, rng=None):
+        """Create a deck with cards in order given by a record from
+        :meth:`record`. Cards missing in the record are dead.
+        """
+        active = [Card._by_id[i] for i in bytearray(record)]
+        deck = cls(dead=CardSet(Card._by_id) - CardSet(active), rng=rng)
+        if len(deck.active) != len(active):
+            raise ValueError('Deck.from_record(): duplicate card in record')
+        deck.active = active
+        return deck
 
     def pop(self):
         """Deal the top card from the deck.
@@ -135,28 +361,46 @@ class Deck(object):
         """
         card = self.active.pop()
         self.popped.append(card)
+        self._popped |= card.mask
         return card
 
     def discard(self):
         card = self.active.pop()
         self.discarded.append(card)
+        self._discarded |= card.mask
 
     def return_cards(self, cards, pos = POS_BOTTOM):
+        """Return popped or discarded cards to the deck.
+
+        :param cards: Cards to return, list or
+           :class:`pokercards.cards.CardSet`.
+        :param pos: Put the cards on top (``POS_TOP``) or to the bottom
+           (``POS_BOTTOM``) of the deck.
+        """
         if pos not in (POS_BOTTOM, POS_TOP):
             raise Exception('Deck.return_cards(): invalid pos parameter')
 
-        for card in cards[:]:
-            if card in self.discarded:
-                self.discarded.remove(card)
-            elif card in self.popped:
-                self.popped.remove(card)
-            else:
+        cards = list(cards)
+        returned = 0
+        for card in cards:
+            if returned & card.mask:
                 raise Exception('Deck.return_cards(): card not among removed cards')
-
-            if pos == POS_BOTTOM:
-                self.active[0:0] = [card]
-            else:
-                self.active.append(card)
+            returned |= card.mask
+        if returned & ~(self._popped | self._discarded):
+            raise Exception('Deck.return_cards(): card not among removed cards')
+
+        if returned & self._discarded:
+            self._discarded &= ~returned
+            self.discarded = [c for c in self.discarded if not c.mask & returned]
+        if returned & self._popped:
+            self._popped &= ~returned
+            self.popped = [c for c in self.popped if not c.mask & returned]
+
+        if pos == POS_BOTTOM:
+            cards.reverse()
+            self.active[0:0] = cards
+        else:
+            self.active.extend(cards)
 
     def return_discarded(self, pos = POS_BOTTOM):
         self.return_cards(self.discarded, pos)
@@ -165,18 +409,170 @@ class Deck(object):
         self.return_cards(self.popped, pos)
 
     def return_all(self, pos = POS_BOTTOM):
-        self.return_popped()
-        self.return_discarded()
+        self.return_cards(self.popped + self.discarded, pos)
+
+    @property
+    def removed(self):
+        """:class:`pokercards.cards.CardSet` of popped and discarded cards."""
+        return CardSet.from_mask(self._popped | self._discarded)
 
     def stats(self):
         return (len(self.active), len(self.popped), len(self.discarded))
 
+    def __contains__(self, card):
+        return not card.mask & (self._popped | self._discarded | self.dead.mask)
+
     def __str__(self):
         return '[%s]' % ' '.join((str(card) for card in self.active))
 
     def __repr__(self):
         return 'Deck(%s)' % self.__str__()
 
+class FastDeck(object):
+    """Deck for simulations, dealing cards in random order without
+    shuffling the whole deck.
+
+    The cards are kept in one fixed list with a cursor separating dealt
+    cards from the rest. Each dealt card is picked at random from the
+    rest (a step of Fisher-Yates shuffle), so only the cards actually
+    needed are shuffled. Resetting the deck just moves the cursor back.
+
+    :param dead: Cards left out of the deck.
+    :type dead: :class:`pokercards.cards.CardSet` or list of
+       :class:`pokercards.cards.Card` objects
+    :param rng: Random generator to use.
+    :type rng: :class:`random.Random`
+    :param seed: Seed for a new random generator, if ``rng`` is not given.
+    :param variant: :class:`pokercards.variants.Variant` whose deck to
+       use.
+    """
+
+    __slots__ = ('cards', 'cursor', 'rng', '_random')
+
+    def __init__(self, dead=None, rng=None, seed=None, variant=None):
+        dead_mask = CardSet(dead).mask
+        if variant is not None:
+            dead_mask |= variant.dead.mask
+        self.cards = [c for c in Card._by_id if not c.mask & dead_mask]
+        self.cursor = 0
+        self.rng = rng if rng is not None else random.Random(seed)
+        self._random = self.rng.random
+
+    def pop(self):
+        """Deal a random card from the rest of the deck.
+
+        :returns: :class:`pokercards.cards.Card` instance
+        :raises: IndexError
+        """
+        cards = self.cards
+        i = self.cursor
+        if i >= len(cards):
+            raise IndexError('FastDeck.pop(): no cards left')
+        j = i + int(self._random() * (len(cards) - i))
+        card = cards[j]
+        cards[j] = cards[i]
+        cards[i] = card
+        self.cursor = i + 1
+        return card
+
+    discard = pop
+
+    def deal(self, count):
+        """Deal ``count`` random cards.
+
+        :returns: list of :class:`pokercards.cards.Card` instances
+        :raises: IndexError
+        """
+        cards = self.cards
+        i = self.cursor
+        end = i + count
+        if end > len(cards):
+            raise IndexError('FastDeck.deal(): not enough cards')
+        rand = self._random
+        while i < end:
+            j = i + int(rand() * (len(cards) - i))
+            cards[i], cards[j] = cards[j], cards[i]
+            i += 1
+        self.cursor = end
+        return cards[end - count:end]
+
+    def reset(self):
+        """Return all dealt cards to the deck."""
+        self.cursor = 0
+
+    shuffle = reset
+
+    @property
+    def dealt(self):
+        """List of cards dealt since the last reset."""
+        return self.cards[:self.cursor]
+
+    def __len__(self):
+        return len(self.cards) - self.cursor
+
+    def __repr__(self):
+        return '%s(%d dealt, %d left)' % (self.__class__.__name__,
+                self.cursor, len(self))
+
+def enable_cache(maxsize=65536):
+    """Make :class:`PokerHand` remember recently evaluated hands.
+
+    Wraps the current :attr:`PokerHand.evaluator` in
+    a :class:`pokercards.evaluator.CachedEvaluator`, or resizes the
+    cache if it is already enabled.
+
+    :returns: The cached evaluator, e.g. to check its
+       :meth:`~pokercards.evaluator.CachedEvaluator.stats`.
+    :raises: ValueError with the classic evaluator
+       (:attr:`PokerHand.evaluator` set to ``None``), which has no
+       strength to cache.
+    """
+    current = PokerHand.evaluator
+    if current is None:
+        raise ValueError('enable_cache(): the classic evaluator can not be cached')
+    if isinstance(current, evaluator.CachedEvaluator):
+        current.maxsize = maxsize
+        return current
+    PokerHand.evaluator = evaluator.CachedEvaluator(current, maxsize)
+    return PokerHand.evaluator
+
+def disable_cache():
+    """Stop caching evaluated hands, see :func:`enable_cache`."""
+    current = PokerHand.evaluator
+    if isinstance(current, evaluator.CachedEvaluator):
+        PokerHand.evaluator = current.backend
+
+def _trace_hand(hand):
+    event = {
+        'cards': [str(c) for c in hand.cards],
+        'strength': hand.strength,
+        'hand_rank': hand.hand_rank,
+        'hand_cards': [str(c) for c in hand.hand_cards],
+        'kickers': [str(c) for c in hand.kickers],
+        }
+    trace_logger.debug('evaluated %s', event, extra={'trace': event})
+
+def _split_hand(strength, hand_rank, cards):
+    """Pick the cards making a hand of given strength out of cards
+    sorted from the highest. Returns (hand cards, kickers)."""
+    values = evaluator.unpack(strength)[1]
+    if hand_rank in (evaluator.FLUSH, evaluator.STRAIGHT_FLUSH):
+        for suit in suits:
+            suited = [c for c in cards if c.suit == suit]
+            if set(values) <= set(c.rank_value for c in suited):
+                cards = suited
+                break
+    picked = []
+    taken = [False] * len(cards)
+    for value in values:
+        for i, card in enumerate(cards):
+            if not taken[i] and card.rank_value == value:
+                taken[i] = True
+                picked.append(card)
+                break
+    count = evaluator.hand_card_counts[hand_rank]
+    return picked[:count], picked[count:]
+
 class PokerHand(object):
     """Compute the best hand from given cards, implementing traditional
     "high" poker hand ranks.
@@ -186,7 +582,10 @@ class PokerHand(object):
     hand.
 
     Evaluated :class:`pokercards.cards.PokerHand` objects are
-    compared and sorted by the rank of the hand.
+    compared and sorted by the rank of the hand. Comparison, equality
+    and hashing all use the integer :attr:`strength`, so tied hands are
+    equal and ``key=operator.attrgetter('strength')`` sorts the same
+    way as the hands themselves.
 
     .. attribute:: cards
 
@@ -195,28 +594,47 @@ class PokerHand(object):
        should be called after manual update to re-evaluate the updated
        hand.
 
+    .. attribute:: evaluator
+
+       Backend used to evaluate the hand, an object with
+       ``evaluate(cards)`` method returning integer strength as
+       described in :mod:`pokercards.evaluator`. Defaults to the shared
+       :class:`pokercards.evaluator.TableEvaluator`. Set to ``None``
+       (on a subclass or an instance) to use the classic evaluation
+       implemented by this class.
+
     Following attributes are available after evaluating the hand.
 
+    .. attribute:: strength
+
+       Integer strength of the hand, higher is better. Packs the hand
+       rank followed by the ranks of :attr:`hand_cards` and
+       :attr:`kickers`, see :mod:`pokercards.evaluator`.
+
     .. attribute:: hand_rank
 
        Readonly rank of the hand (0 = high card to 8 = straight flush)
 
     .. attribute:: hand_cards
 
-       Readonly list of cards which complete the rank.
+       Readonly list of cards which complete the rank. Computed from
+       the strength on first access.
 
     .. attribute:: kickers
 
-       Readonly list of extra cards which can break a tie.
+       Readonly list of extra cards which can break a tie. Computed
+       from the strength on first access.
 
-    :param cards: List of :class:`pokercards.cards.Card` objects.
+    :param cards: List of :class:`pokercards.cards.Card` objects or
+       a :class:`pokercards.cards.CardSet`.
     :param evaluate: Evaluate the hand when creating.
     :type evaluate: bool
     """
 
+    evaluator = evaluator.table_evaluator
+
     def __init__(self, cards, evaluate=True):
-        cards.sort(reverse=True)
-        self.cards = cards
+        self.cards = sorted(cards, reverse=True)
         if evaluate:
             self.evaluate()
 
@@ -228,8 +646,43 @@ class PokerHand(object):
         explicitly by calling this method later, e.g. after changing
         the :attr:`cards` attribute manually.
         """
-        self._eval_hand_rank()
-        self._fill_kickers()
+        if self.evaluator is None:
+            self._eval_hand_rank()
+            self._fill_kickers()
+            self.strength = evaluator.pack(self._hand_rank,
+                    [c.rank_value for c in self._hand_cards + self._kickers])
+        else:
+            self.strength = self.evaluator.evaluate(self.cards)
+            self._hand_cards = None
+            self._kickers = None
+        if _trace:
+            _trace_hand(self)
+
+    @property
+    def hand_rank(self):
+        code = self.strength >> evaluator.RANK_SHIFT
+        hand_ranks = getattr(self.evaluator, 'hand_ranks', None)
+        return hand_ranks[code] if hand_ranks else code
+
+    @property
+    def hand_cards(self):
+        if self._hand_cards is None:
+            self._fill_hand_cards()
+        return self._hand_cards
+
+    @property
+    def kickers(self):
+        if self._kickers is None:
+            self._fill_hand_cards()
+        return self._kickers
+
+    def _fill_hand_cards(self):
+        self._hand_cards, self._kickers = _split_hand(self.strength,
+                self.hand_rank, self.cards)
+
+    def to_record(self):
+        """Return the evaluated hand as a :class:`HandRecord`."""
+        return HandRecord(self.strength, self.hand_rank, CardSet(self.cards).mask)
 
     def _by_rank(self, cards=None):
         if cards is None:
@@ -276,24 +729,18 @@ class PokerHand(object):
         return straights
 
     def _fill_kickers(self):
-        hand_count = len(self.hand_cards)
+        hand_count = len(self._hand_cards)
         kicker_count = 5 - hand_count
         if kicker_count > 0:
-            kickers = self.cards[:]
-            for card in self.hand_cards:
-                kickers.remove(card)
-            self.kickers = kickers[:kicker_count]
+            used = CardSet(self._hand_cards).mask
+            kickers = [c for c in self.cards if not c.mask & used]
+            self._kickers = kickers[:kicker_count]
         else:
-            self.kickers = []
-        logger.debug("kickers: %s", f_list(self.kickers))
-        logger.debug("--- -------------- ---")
+            self._kickers = []
 
     def _eval_hand_rank(self):
-        logger.debug("--- Evaluating %s ---", f_list(self.cards))
         straights = self._find_straights()
-        if straights: logger.debug( "straights: %s", f_lists(straights))
         flushes = self._find_flushes()
-        if flushes: logger.debug("flushes: %s", f_lists(flushes))
         pairs = []
         threes = []
         fours = []
@@ -305,67 +752,54 @@ class PokerHand(object):
                 threes.append(cards)
             elif l == 2:
                 pairs.append(cards)
-        if pairs: logger.debug("pairs: %s", f_lists(pairs))
-        if threes: logger.debug("threes: %s", f_lists(threes))
-        if fours: logger.debug("fours: %s", f_lists(fours))
         # straight flush
         for cards in straights:
             if cards in flushes:
-                self.hand_rank = 8
-                self.hand_cards = cards
-                logger.debug("* straight flush: %s", f_list(self.hand_cards))
+                self._hand_rank = 8
+                self._hand_cards = cards
                 return
         # four of a kind
         if len(fours) > 0:
-            self.hand_rank = 7
-            self.hand_cards = fours[0]
-            logger.debug("* four of a kind: %s", f_list(self.hand_cards))
+            self._hand_rank = 7
+            self._hand_cards = fours[0]
             return
         # full house
         if len(threes) > 1:
-            self.hand_rank = 6
-            self.hand_cards = threes[0] + threes[1][:2]
-            logger.debug("* full house: %s", f_list(self.hand_cards))
+            self._hand_rank = 6
+            self._hand_cards = threes[0] + threes[1][:2]
             return
         elif len(threes) == 1 and len(pairs) > 0:
-            self.hand_rank = 6
-            self.hand_cards = threes[0] + pairs[0]
-            logger.debug("* full house: %s", f_list(self.hand_cards))
+            self._hand_rank = 6
+            self._hand_cards = threes[0] + pairs[0]
             return
         # flush
         if len(flushes) > 0:
-            self.hand_rank = 5
-            self.hand_cards = flushes[0]
-            logger.debug("* flush: %s", f_list(self.hand_cards))
+            self._hand_rank = 5
+            self._hand_cards = flushes[0]
             return
         # straight
         if len(straights) > 0:
-            self.hand_rank = 4
-            self.hand_cards = straights[0]
-            logger.debug("* straight: %s", f_list(self.hand_cards))
+            self._hand_rank = 4
+            self._hand_cards = straights[0]
             return
         # three of a kind
         if len(threes) > 0:
-            self.hand_rank = 3
-            self.hand_cards = threes[0]
-            logger.debug("* three of a kind: %s", f_list(self.hand_cards))
+            self._hand_rank = 3
+            self._hand_cards = threes[0]
             return
         # two pair
         if len(pairs) > 1:
-            self.hand_rank = 2
-            self.hand_cards = pairs[0] + pairs[1]
-            logger.debug("* two pairs: %s", f_list(self.hand_cards))
+            self._hand_rank = 2
+            self._hand_cards = pairs[0] + pairs[1]
             return
         # one pair
         if len(pairs) == 1:
-            self.hand_rank = 1
-            self.hand_cards = pairs[0];
-            logger.debug("* two of a kind: %s", f_list(self.hand_cards))
+            self._hand_rank = 1
+            self._hand_cards = pairs[0];
             return
         # high card
-        self.hand_rank = 0
-        self.hand_cards = [self.cards[0]]
-        logger.debug("* high card: %s", f_list(self.hand_cards))
+        self._hand_rank = 0
+        self._hand_cards = [self.cards[0]]
 
     def __str__(self):
         return '[%s]' % f_list(self.cards)
@@ -374,23 +808,194 @@ class PokerHand(object):
         return '%s(%s)' % (self.__class__.__name__, self.__str__())
 
     def __cmp__(self, other):
-        if self.hand_rank > other.hand_rank:
-            return 1
-        elif self.hand_rank < other.hand_rank:
-            return -1
-        else:
-            # same rank
-            for c1, c2 in zip(self.hand_cards, other.hand_cards):
-                if c1 > c2:
-                    return 1
-                elif c1 < c2:
-                    return -1
-            else:
-                # same cards, check kickers
-                for c1, c2 in zip(self.kickers, other.kickers):
-                    if c1 > c2:
-                        return 1
-                    elif c1 < c2:
-                        return -1
-            # really, a tie
-            return 0
+        return cmp(self.strength, other.strength)
+
+    def __lt__(self, other):
+        return self.strength < other.strength
+
+    def __le__(self, other):
+        return self.strength <= other.strength
+
+    def __gt__(self, other):
+        return self.strength > other.strength
+
+    def __ge__(self, other):
+        return self.strength >= other.strength
+
+    def __eq__(self, other):
+        if not isinstance(other, PokerHand):
+            return NotImplemented
+        return self.strength == other.strength
+
+    def __ne__(self, other):
+        if not isinstance(other, PokerHand):
+            return NotImplemented
+        return self.strength != other.strength
+
+    def __hash__(self):
+        return hash(self.strength)
+
+
+class HandRecord(object):
+    """Compact immutable result of a hand evaluation.
+
+    Keeps only the strength, the hand rank and the card set bitmask of
+    the cards, a fraction of the memory of a :class:`PokerHand`. The
+    cards, :attr:`hand_cards` and :attr:`kickers` are rebuilt from the
+    bitmask on each access. Records compare, and hash, by strength like
+    :class:`PokerHand` objects.
+
+    Created by :func:`evaluate_hand`, :meth:`PokerHand.to_record` or
+    taken from a :class:`HandRecordArray`.
+
+    .. attribute:: strength
+    .. attribute:: hand_rank
+    .. attribute:: mask
+
+       Strength, hand rank and card set bitmask of the cards.
+    """
+
+    __slots__ = ('strength', 'hand_rank', 'mask')
+
+    def __init__(self, strength, hand_rank, mask):
+        object.__setattr__(self, 'strength', strength)
+        object.__setattr__(self, 'hand_rank', hand_rank)
+        object.__setattr__(self, 'mask', mask)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('HandRecord objects are immutable')
+
+    def __reduce__(self):
+        return (HandRecord, (self.strength, self.hand_rank, self.mask))
+
+    @property
+    def cards(self):
+        """List of the cards, from the highest."""
+        return sorted(CardSet.from_mask(self.mask), reverse=True)
+
+    @property
+    def hand_cards(self):
+        return _split_hand(self.strength, self.hand_rank, self.cards)[0]
+
+    @property
+    def kickers(self):
+        return _split_hand(self.strength, self.hand_rank, self.cards)[1]
+
+    def __str__(self):
+        return '[%s]' % f_list(self.cards)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.__str__())
+
+    def __lt__(self, other):
+        return self.strength < other.strength
+
+    def __le__(self, other):
+        return self.strength <= other.strength
+
+    def __gt__(self, other):
+        return self.strength > other.strength
+
+    def __ge__(self, other):
+        return self.strength >= other.strength
+
+    def __eq__(self, other):
+        if not isinstance(other, (HandRecord, PokerHand)):
+            return NotImplemented
+        return self.strength == other.strength
+
+    def __ne__(self, other):
+        if not isinstance(other, (HandRecord, PokerHand)):
+            return NotImplemented
+        return self.strength != other.strength
+
+    def __hash__(self):
+        return hash(self.strength)
+
+def _evaluate_record(cards, evaluator):
+    """Return (strength, hand rank, mask) of cards."""
+    if evaluator is None:
+        evaluator = PokerHand.evaluator
+    if evaluator is None:
+        hand = PokerHand(cards)
+        return hand.strength, hand.hand_rank, CardSet(hand.cards).mask
+    mask = getattr(cards, 'mask', None)
+    if mask is None:
+        mask = 0
+        for card in cards:
+            mask |= card.mask
+    strength = evaluator.evaluate(cards)
+    hand_ranks = getattr(evaluator, 'hand_ranks', None)
+    code = strength >> RANK_SHIFT
+    return strength, hand_ranks[code] if hand_ranks else code, mask
+
+def evaluate_hand(cards, evaluator=None):
+    """Evaluate cards into a :class:`HandRecord`.
+
+    The input is not modified.
+
+    :param cards: List of :class:`pokercards.cards.Card` objects or
+       a :class:`pokercards.cards.CardSet`.
+    :param evaluator: Backend as :attr:`PokerHand.evaluator`, which is
+       used by default.
+    """
+    record = HandRecord(*_evaluate_record(cards, evaluator))
+    if _trace:
+        _trace_hand(record)
+    return record
+
+class HandRecordArray(object):
+    """Evaluated hands stored in columns of machine integers, about 13
+    bytes per hand, for keeping millions of results in memory.
+
+    Indexing and iteration give :class:`HandRecord` objects created on
+    the fly.
+
+    :param hands: Hands to evaluate and append, each a list of
+       :class:`pokercards.cards.Card` objects or
+       a :class:`pokercards.cards.CardSet`.
+    :param evaluator: Backend as :attr:`PokerHand.evaluator`, which is
+       used by default.
+
+    .. attribute:: strengths
+
+       :class:`array.array` of the strengths.
+
+    .. attribute:: hand_ranks
+
+       :class:`array.array` of the hand ranks.
+    """
+
+    __slots__ = ('strengths', 'hand_ranks', '_masks_low', '_masks_high', 'evaluator')
+
+    def __init__(self, hands=(), evaluator=None):
+        self.strengths = array('i')
+        self.hand_ranks = array('B')
+        # card set bitmasks split in halves, 'L' is 32 bit on some systems
+        self._masks_low = array('I')
+        self._masks_high = array('I')
+        self.evaluator = evaluator
+        for cards in hands:
+            self.append(cards)
+
+    def append(self, cards):
+        """Evaluate cards and append the result."""
+        strength, hand_rank, mask = _evaluate_record(cards, self.evaluator)
+        self.strengths.append(strength)
+        self.hand_ranks.append(hand_rank)
+        self._masks_low.append(mask & 0xffffffff)
+        self._masks_high.append(mask >> 32)
+
+    def __getitem__(self, index):
+        return HandRecord(self.strengths[index], self.hand_ranks[index],
+                self._masks_high[index] << 32 | self._masks_low[index])
+
+    def __iter__(self):
+        for i in xrange(len(self.strengths)):
+            yield self[i]
+
+    def __len__(self):
+        return len(self.strengths)
+
+    def __repr__(self):
+        return '%s(%d hands)' % (self.__class__.__name__, len(self))
@@ -0,0 +1,276 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.database` -- Precomputed equities
+==================================================
+
+Equities of starting hands against random opponents, preflop or on each
+flop or turn, precomputed into a compact binary file once::
+
+    python -m pokercards.database equity.db --board 3 --iterations 2000
+
+and looked up later by memory mapping the file::
+
+    db = EquityDatabase('equity.db')
+    db.equity(hole, flop)
+
+Only one situation of each class of suit isomorphic ones (see
+:mod:`pokercards.isomorphism`) is computed. A lookup canonicalizes the
+situation and reads one slot at an index computed from the starting
+hand class and the board cards. The file is never read into memory, the
+operating system pages it in on demand and shares the pages among all
+processes which map it.
+
+File layout, all integers little endian: 16 byte header of magic
+``PKEQ``, format version, board size, number of opponents (unsigned
+shorts) and number of slots (unsigned int, padded), followed by the
+slots as unsigned shorts holding the equity scaled to 0..65534, 65535
+for situations which were not computed.
+"""
+
+import sys
+import mmap
+import struct
+import argparse
+import itertools
+import multiprocessing
+from array import array
+
+from cards import Card, CardSet
+from ranges import class_combos, combo_masks, hand_classes
+from isomorphism import canonical_masks, canonical_boards
+from equity import equity
+from evaluator import table_evaluator
+
+MAGIC = b'PKEQ'
+VERSION = 1
+_header = struct.Struct('<4sHHHxxI')
+#: slot value of situations not in the database
+MISSING = 0xffff
+_SCALE = MISSING - 1
+
+def _binomial(n, k):
+    if k < 0 or k > n:
+        return 0
+    result = 1
+    for i in xrange(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+#: number of boards of each size, i.e. slots per starting hand class
+board_counts = [_binomial(52, k) for k in xrange(6)]
+# _colex[k][card_id] is the combinatorial number system term of a card
+# id at position k (0 based) among the sorted ids of a board
+_colex = [[_binomial(card_id, k + 1) for card_id in xrange(52)] for k in xrange(5)]
+
+#: starting hand class index (into :func:`pokercards.ranges.hand_classes`)
+#: of each hole card combination mask
+combo_class = {}
+for _i, _name in enumerate(hand_classes()):
+    for _combo in class_combos[_name]:
+        combo_class[combo_masks[_combo]] = _i
+del _i, _name, _combo
+
+def _board_index(mask):
+    """Index of board given by card set bitmask among all boards of
+    the same size."""
+    by_bit = Card._by_bit
+    ids = []
+    while mask:
+        low = mask & -mask
+        ids.append(by_bit[low.bit_length() - 1].id)
+        mask ^= low
+    ids.sort()
+    return sum(_colex[k][card_id] for k, card_id in enumerate(ids))
+
+def situation_index(hole_mask, board_mask, board_size):
+    """Slot index of a situation given by card set bitmasks."""
+    (hole_mask, board_mask), perm = canonical_masks((hole_mask, board_mask))
+    index = combo_class[hole_mask] * board_counts[board_size]
+    if board_size:
+        index += _board_index(board_mask)
+    return index
+
+def _compute(args):
+    """Equity of one situation, returns (index, slot value)."""
+    index, hole_mask, board_mask, opponents, iterations, seed = args
+    result = equity(CardSet.from_mask(hole_mask), CardSet.from_mask(board_mask),
+            opponents=opponents, iterations=iterations, seed=seed)
+    return index, int(round(result.equity * _SCALE))
+
+def _situations(board_size, opponents, iterations, classes, seed):
+    for name in classes:
+        # canonical representative of the class, suits in index order
+        hole_mask = canonical_masks((combo_masks[class_combos[name][0]],))[0][0]
+        if board_size:
+            boards = [board for board, count in
+                    canonical_boards(board_size, (hole_mask,))]
+        else:
+            boards = [0]
+        for board_mask in boards:
+            index = situation_index(hole_mask, board_mask, board_size)
+            yield (index, hole_mask, board_mask, opponents, iterations,
+                    None if seed is None else seed + index)
+
+def build_database(path, board_size=0, opponents=1, iterations=10000,
+        classes=None, processes=1, seed=None):
+    """Precompute equities into a database file.
+
+    Equity of each starting hand class is estimated by
+    :func:`pokercards.equity.equity` on every board of ``board_size``
+    cards, up to suit isomorphism.
+
+    :param path: Name of the file to write.
+    :param board_size: Number of board cards, 0 (preflop), 3 or 4.
+    :param opponents: Number of opponents with random hands.
+    :param iterations: Monte Carlo trials per situation.
+    :param classes: Names of the starting hand classes to compute,
+       all 169 by default. Slots of the others are left missing.
+    :param processes: Number of worker processes, ``None`` uses all
+       CPUs.
+    :param seed: Base seed, each situation is seeded by its index.
+    :returns: Number of computed situations.
+    :raises: ValueError
+    """
+    if board_size not in (0, 3, 4):
+        raise ValueError('build_database(): board size must be 0, 3 or 4')
+    names = hand_classes()
+    if classes is None:
+        classes = names
+    for name in classes:
+        if name not in class_combos:
+            raise ValueError('build_database(): unknown hand class %s' % name)
+    count = len(names) * board_counts[board_size]
+    slots = array('H', [MISSING]) * count
+    tasks = _situations(board_size, opponents, iterations, classes, seed)
+    computed = 0
+    if processes == 1:
+        results = itertools.imap(_compute, tasks)
+        pool = None
+    else:
+        # workers forked now share the tables instead of building them
+        table_evaluator.build()
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_compute, tasks, 64)
+    try:
+        for index, value in results:
+            slots[index] = value
+            computed += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    if sys.byteorder != 'little':
+        slots.byteswap()
+    with open(path, 'wb') as f:
+        f.write(_header.pack(MAGIC, VERSION, board_size, opponents, count))
+        slots.tofile(f)
+    return computed
+
+class EquityDatabase(object):
+    """Read only view of a database written by :func:`build_database`.
+
+    :param path: Name of the database file.
+    :raises: ValueError
+
+    .. attribute:: board_size
+    .. attribute:: opponents
+
+       Number of board cards and opponents the equities were computed
+       for.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _header.size:
+            self.close()
+            raise ValueError('EquityDatabase(): file too short')
+        magic, version, self.board_size, self.opponents, count = \
+                _header.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('EquityDatabase(): not an equity database')
+        if len(self._map) != _header.size + 2 * count:
+            self.close()
+            raise ValueError('EquityDatabase(): file size does not match header')
+        self._count = count
+
+    def equity(self, hole, board=None):
+        """Look up equity of hole cards on a board.
+
+        :param hole: Two hole cards.
+        :param board: Board cards, as many as the database was built for.
+        :returns: Equity as float.
+        :raises: KeyError if the situation was not computed,
+           ValueError on wrong number of cards.
+        """
+        hole_mask = CardSet(hole).mask
+        board_mask = CardSet(board).mask
+        if hole_mask not in combo_class:
+            raise ValueError('EquityDatabase.equity(): need two hole cards')
+        if bin(board_mask).count('1') != self.board_size or hole_mask & board_mask:
+            raise ValueError('EquityDatabase.equity(): need %d board cards'
+                    % self.board_size)
+        index = situation_index(hole_mask, board_mask, self.board_size)
+        value, = struct.unpack_from('<H', self._map, _header.size + 2 * index)
+        if value == MISSING:
+            raise KeyError('EquityDatabase.equity(): situation not in database')
+        return float(value) / _SCALE
+
+    def close(self):
+        """Unmap the file."""
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pokercards.database',
+            description='Precompute an equity database.')
+    parser.add_argument('output', help='database file to write')
+    parser.add_argument('-b', '--board', type=int, default=0, choices=(0, 3, 4),
+            help='number of board cards (default 0)')
+    parser.add_argument('-o', '--opponents', type=int, default=1,
+            help='number of random opponents (default 1)')
+    parser.add_argument('-i', '--iterations', type=int, default=10000,
+            help='trials per situation (default 10000)')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+            help='worker processes (default all CPUs)')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+            help='random seed')
+    parser.add_argument('classes', nargs='*',
+            help='starting hand classes to compute (default all)')
+    args = parser.parse_args(argv)
+    count = build_database(args.output, args.board, args.opponents,
+            args.iterations, args.classes or None, args.processes, args.seed)
+    sys.stdout.write('%d situations\n' % count)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,673 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.equity` -- Hand equity calculation
+===================================================
+
+Estimate the probability of a Texas Hold'em hand winning against random
+opponent hands, given a partial board, or compute exact equities of known
+hands by enumerating all remaining runouts. :func:`range_equity` plays
+every combination of a hand range against every combination of another.
+"""
+
+import math
+import time
+import bisect
+import random
+import logging
+import operator
+import itertools
+import multiprocessing
+from collections import deque
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from cards import Deck, CardSet
+from evaluator import table_evaluator
+from isomorphism import interchangeable_suits
+
+logger = logging.getLogger(__name__)
+
+BOARD_SIZE = 5
+
+class EquityResult(object):
+    """Result of an equity calculation.
+
+    .. attribute:: trials
+
+       Number of evaluated showdowns.
+
+    .. attribute:: wins
+    .. attribute:: ties
+    .. attribute:: losses
+
+       Number of showdowns won outright, tied and lost.
+
+    .. attribute:: equity
+
+       Expected share of the pot, counting a tie among ``n`` hands as
+       ``1/n`` of a win.
+
+    .. attribute:: interval
+
+       Tuple (low, high) of the confidence interval of :attr:`equity`.
+       Zero width for exact results.
+    """
+
+    def __init__(self, confidence=0.95):
+        self.confidence = confidence
+        self.trials = 0
+        self.wins = 0
+        self.ties = 0
+        self.losses = 0
+        self.share = 0.0
+        self.share_sq = 0.0
+        self.exact = False
+
+    def merge(self, counts):
+        """Add counts (trials, wins, ties, losses, share, share_sq)."""
+        trials, wins, ties, losses, share, share_sq = counts
+        self.trials += trials
+        self.wins += wins
+        self.ties += ties
+        self.losses += losses
+        self.share += share
+        self.share_sq += share_sq
+
+    @property
+    def win(self):
+        return float(self.wins) / self.trials if self.trials else 0.0
+
+    @property
+    def tie(self):
+        return float(self.ties) / self.trials if self.trials else 0.0
+
+    @property
+    def loss(self):
+        return float(self.losses) / self.trials if self.trials else 0.0
+
+    @property
+    def equity(self):
+        return self.share / self.trials if self.trials else 0.0
+
+    @property
+    def stderr(self):
+        """Standard error of :attr:`equity`."""
+        if self.exact or self.trials < 2:
+            return 0.0
+        mean = self.equity
+        var = max(self.share_sq / self.trials - mean * mean, 0.0)
+        return math.sqrt(var / (self.trials - 1))
+
+    @property
+    def interval(self):
+        half = _z_score(self.confidence) * self.stderr
+        return (max(self.equity - half, 0.0), min(self.equity + half, 1.0))
+
+    def __repr__(self):
+        low, high = self.interval
+        return '%s(equity=%.4f [%.4f, %.4f], win=%.4f, tie=%.4f, trials=%d)' % (
+                self.__class__.__name__, self.equity, low, high,
+                self.win, self.tie, self.trials)
+
+def _z_score(confidence):
+    # two-sided normal quantile by bisection on erf
+    low, high = 0.0, 10.0
+    for i in xrange(60):
+        mid = (low + high) / 2
+        if math.erf(mid / math.sqrt(2)) < confidence:
+            low = mid
+        else:
+            high = mid
+    return low
+
+def _card_mask(cards, name):
+    cardset = CardSet(cards)
+    if cards is not None and not isinstance(cards, CardSet) \
+            and len(cardset) != len(cards):
+        raise ValueError('equity(): duplicate card in %s' % name)
+    return cardset.mask
+
+def _known_masks(hole, board, dead):
+    hole_mask = _card_mask(hole, 'hole')
+    board_mask = _card_mask(board, 'board')
+    dead_mask = _card_mask(dead, 'dead')
+    if bin(hole_mask).count('1') != 2:
+        raise ValueError('equity(): hole must be two cards')
+    if bin(board_mask).count('1') > BOARD_SIZE:
+        raise ValueError('equity(): board has more than five cards')
+    if hole_mask & board_mask or (hole_mask | board_mask) & dead_mask:
+        raise ValueError('equity(): hole, board and dead cards overlap')
+    return hole_mask, board_mask, dead_mask
+
+def _showdown(hero, opponents):
+    """Counts for one showdown of hero strength against opponents'."""
+    best = max(opponents)
+    if hero > best:
+        return 1
+    if hero < best:
+        return 0
+    return 1.0 / (1 + opponents.count(hero))
+
+def _range_table(hand_range, known):
+    """Combination masks and cumulative weights of a range, without
+    combinations blocked by known cards."""
+    masks, weights = hand_range.remove_dead(CardSet.from_mask(known)).masks()
+    if not masks:
+        raise ValueError('equity(): range has no combination left')
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return masks, cumulative
+
+def _pick_ranges(rng, range_tables, used, attempts=10000):
+    """Pick one combination of each range not colliding with used cards
+    or each other. On a collision all ranges are picked again, so the
+    combinations come with the weights of the valid deals. Returns list
+    of masks, or None if no valid deal came up in ``attempts`` tries."""
+    for attempt in xrange(attempts):
+        picked = []
+        taken = used
+        for masks, cumulative in range_tables:
+            total = cumulative[-1]
+            mask = masks[bisect.bisect(cumulative, rng.random() * total)
+                    if total else 0]
+            if mask & taken:
+                break
+            taken |= mask
+            picked.append(mask)
+        else:
+            return picked
+    return None
+
+def _ranges_possible(range_tables, used):
+    """Whether one combination of each range can be picked without
+    colliding with used cards or each other."""
+    tables = sorted(range_tables, key=lambda table: len(table[0]))
+    seen = set()
+    def search(i, used):
+        if i == len(tables):
+            return True
+        if (i, used) in seen:
+            return False
+        seen.add((i, used))
+        for mask in tables[i][0]:
+            if not mask & used and search(i + 1, used | mask):
+                return True
+        return False
+    return search(0, used)
+
+def _simulate(args):
+    """Run one chunk of random showdowns, return the counts."""
+    hole_mask, board_mask, dead_mask, opponents, trials, seed, range_tables = args
+    evaluate = table_evaluator.evaluate_mask
+    rng = random.Random(seed)
+    known = hole_mask | board_mask | dead_mask
+    deck = Deck(dead=CardSet.from_mask(known))
+    stub = [card.mask for card in deck.active]
+    missing = BOARD_SIZE - bin(board_mask).count('1')
+    need = missing + 2 * (opponents - len(range_tables))
+    wins = ties = losses = 0
+    share = share_sq = 0.0
+    for i in xrange(trials):
+        if range_tables:
+            picked = _pick_ranges(rng, range_tables, known)
+            if picked is None:
+                raise ValueError('equity(): could not deal hands from the ranges')
+            used = 0
+            for mask in picked:
+                used |= mask
+            drawn = rng.sample([m for m in stub if not m & used], need)
+        else:
+            picked = ()
+            drawn = rng.sample(stub, need)
+        board = board_mask
+        for mask in drawn[:missing]:
+            board |= mask
+        hero = evaluate(hole_mask | board)
+        opps = [evaluate(board | drawn[j] | drawn[j + 1])
+                for j in xrange(missing, need, 2)]
+        opps.extend(evaluate(board | mask) for mask in picked)
+        result = _showdown(hero, opps)
+        if result == 1:
+            wins += 1
+        elif result == 0:
+            losses += 1
+        else:
+            ties += 1
+        share += result
+        share_sq += result * result
+    return (trials, wins, ties, losses, share, share_sq)
+
+def equity(hole, board=None, dead=None, opponents=1, iterations=100000,
+        time_limit=None, precision=None, confidence=0.95, processes=1,
+        pool=None, seed=None, chunk_size=2000, ranges=None):
+    """Estimate equity of Texas Hold'em hole cards by Monte Carlo simulation.
+
+    Random opponent hands and the rest of the board are dealt from the
+    remaining cards and showdowns are evaluated until ``iterations``
+    trials are done, ``time_limit`` expires, or the confidence interval
+    gets narrower than ``precision``, whichever comes first.
+
+    Trials run in chunks of ``chunk_size``, each with its own random
+    generator seeded from ``seed``, so results are reproducible for
+    a given seed regardless of the number of processes.
+
+    :param hole: Two hole cards of the hero.
+    :param board: Up to five board cards.
+    :param dead: Cards known to be out of play.
+    :param opponents: Number of opponents with random hands.
+    :param ranges: List of :class:`pokercards.ranges.Range` objects,
+       hands of the first ``len(ranges)`` opponents are picked from
+       these according to the weights. If there are more ranges than
+       ``opponents``, the number of ranges is used.
+    :param iterations: Maximum number of trials, ``None`` for no limit
+       when ``time_limit`` or ``precision`` is given.
+    :param time_limit: Maximum time to spend in seconds.
+    :param precision: Stop when half width of the confidence interval
+       drops below this.
+    :param confidence: Confidence level of the interval.
+    :param processes: Number of worker processes, 1 runs in the
+       calling process, ``None`` uses all CPUs.
+    :param pool: Existing :class:`multiprocessing.pool.Pool` to use
+       instead of starting a new one.
+    :param seed: Seed for the random generators.
+    :returns: :class:`pokercards.equity.EquityResult`
+    :raises: ValueError
+    """
+    ranges = ranges or []
+    opponents = max(opponents, len(ranges))
+    if opponents < 1:
+        raise ValueError('equity(): need at least one opponent')
+    hole_mask, board_mask, dead_mask = _known_masks(hole, board, dead)
+    range_tables = [_range_table(r, hole_mask | board_mask | dead_mask)
+            for r in ranges]
+    if not _ranges_possible(range_tables, hole_mask | board_mask | dead_mask):
+        raise ValueError('equity(): ranges can not be dealt at the same time')
+    if iterations is None and time_limit is None and precision is None:
+        raise ValueError('equity(): need iterations, time_limit or precision')
+    known = bin(hole_mask | board_mask | dead_mask).count('1')
+    if known + BOARD_SIZE - bin(board_mask).count('1') + 2 * opponents > 52:
+        raise ValueError('equity(): not enough cards for all opponents')
+
+    result = EquityResult(confidence)
+    master = random.Random(seed)
+    deadline = time.time() + time_limit if time_limit is not None else None
+    state = {'scheduled': 0}
+
+    def next_chunk():
+        if iterations is None:
+            trials = chunk_size
+        else:
+            trials = min(chunk_size, iterations - state['scheduled'])
+        if trials <= 0:
+            return None
+        state['scheduled'] += trials
+        return (hole_mask, board_mask, dead_mask, opponents, trials,
+                master.getrandbits(64), range_tables)
+
+    def done():
+        if iterations is not None and result.trials >= iterations:
+            return True
+        if deadline is not None and time.time() >= deadline:
+            return True
+        if precision is not None and result.trials >= chunk_size:
+            low, high = result.interval
+            if (high - low) / 2 <= precision:
+                return True
+        return False
+
+    if processes == 1 and pool is None:
+        while not done():
+            result.merge(_simulate(next_chunk()))
+        logger.debug('equity: %r', result)
+        return result
+
+    own_pool = pool is None
+    if own_pool:
+        # workers forked now share the tables instead of building them
+        table_evaluator.build()
+        pool = multiprocessing.Pool(processes)
+    try:
+        width = 2 * (processes or multiprocessing.cpu_count())
+        pending = deque()
+        while True:
+            while len(pending) < width:
+                chunk = next_chunk()
+                if chunk is None:
+                    break
+                pending.append(pool.apply_async(_simulate, (chunk,)))
+            if not pending:
+                break
+            result.merge(pending.popleft().get())
+            if done():
+                break
+    finally:
+        if own_pool:
+            pool.terminate()
+            pool.join()
+    logger.debug('equity: %r', result)
+    return result
+
+def _runout_weight(runout, classes):
+    """Number of runouts isomorphic to ``runout``, zero if it is not
+    the canonical one of them."""
+    weight = 1
+    for suits in classes:
+        values = [runout >> 16 * suit & 0x1fff for suit in suits]
+        if any(values[i] < values[i + 1] for i in xrange(len(values) - 1)):
+            return 0
+        weight *= math.factorial(len(values))
+        for count in [values.count(v) for v in set(values)]:
+            weight //= math.factorial(count)
+    return weight
+
+def _enumerate(args):
+    """Enumerate runouts starting with given stub cards, return the counts."""
+    hand_masks, board_mask, stub, missing, firsts, classes = args
+    evaluate = table_evaluator.evaluate_mask
+    players = len(hand_masks)
+    counts = [[0, 0, 0, 0.0] for i in xrange(players)]
+    total = 0
+    if missing == 0:
+        # the board is complete, only the task given the first stub
+        # card counts the single runout
+        runouts = [((), 0)] if firsts else []
+    else:
+        runouts = ((stub[first:first + 1] + list(rest), first)
+                for first in firsts
+                for rest in itertools.combinations(stub[first + 1:], missing - 1))
+    for cards, first in runouts:
+        runout = 0
+        for mask in cards:
+            runout |= mask
+        weight = _runout_weight(runout, classes) if classes else 1
+        if not weight:
+            continue
+        total += weight
+        board = board_mask | runout
+        strengths = [evaluate(board | hand) for hand in hand_masks]
+        best = max(strengths)
+        winners = strengths.count(best)
+        for i in xrange(players):
+            if strengths[i] != best:
+                counts[i][2] += weight
+            elif winners == 1:
+                counts[i][0] += weight
+                counts[i][3] += weight
+            else:
+                counts[i][1] += weight
+                counts[i][3] += float(weight) / winners
+    return total, counts
+
+def exact_equity(hands, board=None, dead=None, processes=1, pool=None):
+    """Compute exact equities of known Texas Hold'em hands.
+
+    All remaining runouts of the board are enumerated. Runouts which
+    differ only by exchanging suits that play no role in the known
+    cards are evaluated once and counted with their multiplicity.
+
+    :param hands: List of two-card hole hands, one for each player.
+    :param board: Up to five board cards.
+    :param dead: Cards known to be out of play.
+    :param processes: Number of worker processes, 1 runs in the
+       calling process, ``None`` uses all CPUs.
+    :param pool: Existing :class:`multiprocessing.pool.Pool` to use
+       instead of starting a new one.
+    :returns: List of :class:`pokercards.equity.EquityResult`, one for
+       each hand, with :attr:`trials` being the number of runouts.
+    :raises: ValueError
+    """
+    if len(hands) < 2:
+        raise ValueError('exact_equity(): need at least two hands')
+    hand_masks = []
+    known = 0
+    for hand in hands:
+        hand_mask, board_mask, dead_mask = _known_masks(hand, board, dead)
+        if hand_mask & known:
+            raise ValueError('exact_equity(): hands overlap')
+        known |= hand_mask
+        hand_masks.append(hand_mask)
+    known |= board_mask | dead_mask
+    stub = [card.mask for card in Deck(dead=CardSet.from_mask(known)).active]
+    missing = BOARD_SIZE - bin(board_mask).count('1')
+    if missing > len(stub):
+        raise ValueError('exact_equity(): not enough cards for the board')
+    classes = interchangeable_suits(hand_masks + [board_mask, dead_mask])
+    # with a complete board there is a single runout, for a single task
+    firsts = range(len(stub) - missing + 1) if missing else [0]
+
+    if processes == 1 and pool is None:
+        parts = [_enumerate((hand_masks, board_mask, stub, missing, firsts, classes))]
+    else:
+        own_pool = pool is None
+        if own_pool:
+            # workers forked now share the tables instead of building them
+            table_evaluator.build()
+            pool = multiprocessing.Pool(processes)
+        try:
+            width = 4 * (processes or multiprocessing.cpu_count())
+            tasks = [(hand_masks, board_mask, stub, missing, firsts[i::width], classes)
+                    for i in xrange(min(width, len(firsts)))]
+            parts = pool.map(_enumerate, tasks)
+        finally:
+            if own_pool:
+                pool.terminate()
+                pool.join()
+
+    results = []
+    for i in xrange(len(hands)):
+        result = EquityResult()
+        result.exact = True
+        for total, counts in parts:
+            wins, ties, losses, share = counts[i]
+            result.merge((total, wins, ties, losses, share, 0.0))
+        results.append(result)
+    return results
+
+def _range_runouts(stub, missing, firsts, trials, seed):
+    """Runout masks, all of them starting with the stub cards at
+    ``firsts`` or ``trials`` random ones."""
+    if trials is not None:
+        rng = random.Random(seed)
+        for i in xrange(trials):
+            runout = 0
+            for mask in rng.sample(stub, missing):
+                runout |= mask
+            yield runout
+    elif missing == 0:
+        if firsts:
+            yield 0
+    else:
+        for first in firsts:
+            for rest in itertools.combinations(stub[first + 1:], missing - 1):
+                runout = stub[first]
+                for mask in rest:
+                    runout |= mask
+                yield runout
+
+def _range_chunk(args):
+    """Play combinations of two ranges against each other on a part of
+    the runouts, return flat lists (scores, counts) of the pairs."""
+    a_masks, b_masks, board_mask, stub, missing, firsts, trials, seed = args
+    evaluator = table_evaluator
+    evaluator.build()
+    nonflush = evaluator._nonflush
+    flush = evaluator._flush
+    mask_quinary = evaluator._mask_quinary
+    # each distinct combination is evaluated once per runout
+    hands = sorted(set(a_masks) | set(b_masks))
+    position = dict((mask, i) for i, mask in enumerate(hands))
+    hand_keys = [sum(mask_quinary[mask >> shift & 0x1fff] for shift in (0, 16, 32, 48))
+            for mask in hands]
+    a_pos = [position[mask] for mask in a_masks]
+    b_pos = [position[mask] for mask in b_masks]
+    width = len(b_masks)
+    if numpy is not None:
+        a_index = numpy.array(a_pos, dtype=numpy.intp)
+        b_index = numpy.array(b_pos, dtype=numpy.intp)
+        apart = numpy.array([[not a & b for b in b_masks] for a in a_masks],
+                dtype=bool).reshape(len(a_masks), width)
+        scores = numpy.zeros(apart.shape, dtype=numpy.int64)
+        counts = numpy.zeros(apart.shape, dtype=numpy.int64)
+    else:
+        rows = [(a_pos[i], [(b_pos[j], i * width + j) for j in xrange(width)
+                    if not a_masks[i] & b_masks[j]])
+                for i in xrange(len(a_masks))]
+        scores = [0] * (len(a_masks) * width)
+        counts = [0] * (len(a_masks) * width)
+    for runout in _range_runouts(stub, missing, firsts, trials, seed):
+        board = board_mask | runout
+        key = 0
+        flush_shift = None
+        for shift in (0, 16, 32, 48):
+            suit_mask = board >> shift & 0x1fff
+            key += mask_quinary[suit_mask]
+            # with two hole cards only a suit with three board cards can flush
+            if bin(suit_mask).count('1') >= 3:
+                flush_shift = shift
+        strengths = []
+        for i, hand in enumerate(hands):
+            if hand & board:
+                strengths.append(None)
+                continue
+            strength = nonflush[key + hand_keys[i]]
+            if flush_shift is not None:
+                suited = flush[(board | hand) >> flush_shift & 0x1fff]
+                if suited > strength:
+                    strength = suited
+            strengths.append(strength)
+        if numpy is not None:
+            values = numpy.array([-1 if x is None else x for x in strengths],
+                    dtype=numpy.int64)
+            mine = values[a_index][:, None]
+            theirs = values[b_index][None, :]
+            valid = apart & (mine >= 0) & (theirs >= 0)
+            counts += valid
+            scores += valid * (2 * (mine > theirs) + (mine == theirs))
+            continue
+        for a, row in rows:
+            mine = strengths[a]
+            if mine is None:
+                continue
+            for b, k in row:
+                theirs = strengths[b]
+                if theirs is None:
+                    continue
+                counts[k] += 1
+                if mine > theirs:
+                    scores[k] += 2
+                elif mine == theirs:
+                    scores[k] += 1
+    if numpy is not None:
+        return scores.ravel().tolist(), counts.ravel().tolist()
+    return scores, counts
+
+def range_equity(range_a, range_b, board=None, dead=None, iterations=None,
+        processes=1, pool=None, seed=None):
+    """Compute equity of every combination of one range against every
+    combination of another.
+
+    Without ``iterations`` all runouts of the board are enumerated, which
+    is practical from the flop on. Each distinct hand is evaluated once
+    per runout, on top of the evaluation of the board shared by all
+    combinations.
+
+    :param range_a: :class:`pokercards.ranges.Range` of the rows.
+    :param range_b: :class:`pokercards.ranges.Range` of the columns.
+    :param board: Up to five board cards.
+    :param dead: Cards known to be out of play.
+    :param iterations: Number of random runouts to sample instead of
+       enumerating all of them.
+    :param processes: Number of worker processes, 1 runs in the
+       calling process, ``None`` uses all CPUs.
+    :param pool: Existing :class:`multiprocessing.pool.Pool` to use
+       instead of starting a new one.
+    :param seed: Seed of the sampled runouts.
+    :returns: Matrix of equities of the combinations of ``range_a``
+       against the combinations of ``range_b``, both in the order of
+       :meth:`pokercards.ranges.Range.masks`. Pairs of combinations
+       sharing a card or blocked by the board or dead cards are NaN. A
+       NumPy array if NumPy is available, list of lists otherwise.
+    :raises: ValueError
+    """
+    board_mask = _card_mask(board, 'board')
+    dead_mask = _card_mask(dead, 'dead')
+    if board_mask & dead_mask:
+        raise ValueError('range_equity(): card on the board is also dead')
+    missing = BOARD_SIZE - bin(board_mask).count('1')
+    if missing < 0:
+        raise ValueError('range_equity(): more than %d board cards' % BOARD_SIZE)
+    a_masks = range_a.masks()[0]
+    b_masks = range_b.masks()[0]
+    known = board_mask | dead_mask
+    stub = [card.mask for card in Deck(dead=CardSet.from_mask(known)).active]
+    if missing + 4 > len(stub):
+        raise ValueError('range_equity(): not enough cards for the board')
+
+    if iterations is None:
+        # with a complete board there is a single runout, for a single task
+        firsts = range(len(stub) - missing + 1) if missing else [0]
+        def task(i, width):
+            return (a_masks, b_masks, board_mask, stub, missing,
+                    firsts[i::width], None, None)
+        tasks = len(firsts)
+    else:
+        master = random.Random(seed)
+        def task(i, width):
+            trials = iterations // width + (i < iterations % width)
+            return (a_masks, b_masks, board_mask, stub, missing,
+                    None, trials, master.getrandbits(64))
+        tasks = iterations
+
+    if processes == 1 and pool is None:
+        parts = [_range_chunk(task(0, 1))]
+    else:
+        own_pool = pool is None
+        if own_pool:
+            # workers forked now share the tables instead of building them
+            table_evaluator.build()
+            pool = multiprocessing.Pool(processes)
+        try:
+            width = min(4 * (processes or multiprocessing.cpu_count()), tasks) or 1
+            parts = pool.map(_range_chunk, [task(i, width) for i in xrange(width)])
+        finally:
+            if own_pool:
+                pool.terminate()
+                pool.join()
+
+    scores, counts = parts[0]
+    for part_scores, part_counts in parts[1:]:
+        scores = map(operator.add, scores, part_scores)
+        counts = map(operator.add, counts, part_counts)
+    width = len(b_masks)
+    matrix = [[scores[k] / (2.0 * counts[k]) if counts[k] else float('nan')
+            for k in xrange(i * width, (i + 1) * width)]
+            for i in xrange(len(a_masks))]
+    if numpy is not None:
+        return numpy.array(matrix, dtype=numpy.float64).reshape(len(a_masks), width)
+    return matrix
@@ -0,0 +1,674 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.evaluator` -- Table driven hand evaluation
+===========================================================
+
+Evaluate "high" poker hands of any number of cards into a single
+integer strength using precomputed lookup tables.
+
+The strength packs the hand rank (0 = high card to 8 = straight flush)
+into bits 20 and up, followed by five 4-bit fields holding the ranks of
+the best five cards in order of significance (the cards completing the
+hand first, then the kickers). Rank fields hold the rank value plus one
+(1 = deuce to 13 = ace), zero marks a missing card in hands of fewer
+than five cards. Comparing two strengths as integers is the same as
+comparing the hands.
+
+Non-flush hands are looked up by a key summing ``5 ** rank`` over all
+cards, which identifies the multiset of ranks. Flushes are looked up by
+the 13-bit mask of ranks held in one suit.
+
+Card set bitmasks (see :class:`pokercards.cards.CardSet`) hold 16 bits
+per suit, bit ``16 * suit_index + rank_value`` for each card.
+
+Omaha hands, which must use exactly two hole cards and three board
+cards, are evaluated by :meth:`TableEvaluator.evaluate_omaha`.
+
+Importing the module does not build any tables, they are built (about
+a second) or loaded from a cache file on first use. Short-lived worker
+processes can skip the build by pointing the ``POKERCARDS_TABLES``
+environment variable at a file precompiled with::
+
+    python -m pokercards.evaluator tables.bin
+
+Long-running servers can call :func:`warm_up` at start so the first
+hand is not slow, and processes forked afterwards share the tables.
+"""
+
+import os
+import sys
+import mmap
+import struct
+import marshal
+import logging
+import threading
+import itertools
+from array import array
+from collections import OrderedDict
+
+from const import suits, ranks
+
+logger = logging.getLogger(__name__)
+
+HIGH_CARD = 0
+ONE_PAIR = 1
+TWO_PAIRS = 2
+THREE_OF_A_KIND = 3
+STRAIGHT = 4
+FLUSH = 5
+FULL_HOUSE = 6
+FOUR_OF_A_KIND = 7
+STRAIGHT_FLUSH = 8
+
+#: number of cards completing the hand for each hand rank, the rest
+#: of the best five cards are kickers
+hand_card_counts = (1, 2, 4, 3, 5, 5, 5, 4, 5)
+
+#: rank value of each rank, 0 for deuce up to 12 for ace
+rank_values = dict((r, len(ranks) - 1 - i) for i, r in enumerate(ranks))
+# rank value of each card id
+_deck_values = [rank_values[r] for s in suits for r in ranks]
+
+RANK_SHIFT = 20
+
+def pack(hand_rank, values):
+    """Pack hand rank and up to five rank values into a strength."""
+    strength = hand_rank
+    for i in xrange(5):
+        strength <<= 4
+        if i < len(values):
+            strength |= values[i] + 1
+    return strength
+
+def unpack(strength):
+    """Split strength into the hand rank and list of rank values."""
+    values = []
+    for shift in (16, 12, 8, 4, 0):
+        v = (strength >> shift) & 0xf
+        if v:
+            values.append(v - 1)
+    return strength >> RANK_SHIFT, values
+
+#: hand ranks from the lowest to the highest in standard poker
+STANDARD_ORDER = (HIGH_CARD, ONE_PAIR, TWO_PAIRS, THREE_OF_A_KIND, STRAIGHT,
+        FLUSH, FULL_HOUSE, FOUR_OF_A_KIND, STRAIGHT_FLUSH)
+
+# version of the table cache file layout
+_CACHE_FORMAT = 2
+# cache file header: magic, length of the signature, nonflush entries
+_CACHE_HEADER = struct.Struct('<4sII')
+_CACHE_MAGIC = 'PKTB'
+
+def straight_values(values, ace_low=True):
+    """List all straights of a deck.
+
+    :param values: Rank values in the deck.
+    :param ace_low: The ace also counts below the lowest rank.
+    :returns: List of straights as lists of rank values from the top
+       card down, the highest straight first.
+    """
+    values = sorted(set(values))
+    if ace_low and 12 in values:
+        values = [12] + values
+    return [values[i:i + 5][::-1] for i in xrange(len(values) - 5, -1, -1)]
+
+class TableEvaluator(object):
+    """Evaluate hands using precomputed lookup tables.
+
+    The tables are built on first use and shared by all hands using
+    the evaluator. The rules are those of standard poker unless given
+    otherwise, see :mod:`pokercards.variants`.
+
+    :param ranks: Ranks in the deck, all by default.
+    :param hand_order: Hand ranks from the lowest to the highest,
+       :data:`STANDARD_ORDER` by default.
+    :param ace_low: The ace also makes the lowest straight.
+    :param cache: File name to load the tables from, or to save them
+       to after building them. The file is read through ``mmap``.
+
+    .. attribute:: hand_ranks
+
+       Tuple mapping the rank field of a strength (``strength >>
+       RANK_SHIFT``) to the hand rank, the same as ``hand_order``.
+    """
+
+    def __init__(self, ranks=None, hand_order=None, ace_low=True, cache=None):
+        self._nonflush = None
+        self._flush = None
+        self._straights = None
+        self._mask_quinary = None
+        self._rank_values = sorted(rank_values[r] for r in (ranks or rank_values))
+        self._straight_list = straight_values(self._rank_values, ace_low)
+        self._straight_masks = [sum(1 << v for v in values)
+                for values in self._straight_list]
+        self.hand_ranks = tuple(hand_order) if hand_order else STANDARD_ORDER
+        self._codes = [0] * len(self.hand_ranks)
+        for code, hand_rank in enumerate(self.hand_ranks):
+            self._codes[hand_rank] = code
+        self.cache = cache
+        # per card id, in the order of a new deck
+        self._quinary = [5 ** v for v in _deck_values]
+        self._bits = [1 << v for v in _deck_values]
+        # per card set bit
+        self._bit_quinary = [5 ** (bit & 15) for bit in xrange(64)]
+
+    def _pack(self, hand_rank, values):
+        return pack(self._codes[hand_rank], values)
+
+    def _straight_top(self, mask):
+        """Index of the highest straight in rank mask, -1 for none."""
+        for i, window in enumerate(self._straight_masks):
+            if mask & window == window:
+                return i
+        return -1
+
+    def _straight_values(self, top):
+        return self._straight_list[top]
+
+    def _counts_value(self, counts):
+        desc = [r for r in xrange(12, -1, -1) if counts[r]]
+        quads = [r for r in desc if counts[r] >= 4]
+        trips = [r for r in desc if counts[r] >= 3]
+        pairs = [r for r in desc if counts[r] >= 2]
+        for hand_rank in reversed(self.hand_ranks):
+            if hand_rank == FOUR_OF_A_KIND:
+                if quads:
+                    q = quads[0]
+                    return self._pack(FOUR_OF_A_KIND,
+                            [q] * 4 + [r for r in desc if r != q][:1])
+            elif hand_rank == FULL_HOUSE:
+                if trips and len(pairs) > 1:
+                    t = trips[0]
+                    p = [r for r in pairs if r != t][0]
+                    return self._pack(FULL_HOUSE, [t] * 3 + [p] * 2)
+            elif hand_rank == STRAIGHT:
+                if len(desc) >= 5:
+                    mask = 0
+                    for r in desc:
+                        mask |= 1 << r
+                    top = self._straights[mask]
+                    if top >= 0:
+                        return self._pack(STRAIGHT, self._straight_values(top))
+            elif hand_rank == THREE_OF_A_KIND:
+                if trips:
+                    t = trips[0]
+                    return self._pack(THREE_OF_A_KIND,
+                            [t] * 3 + [r for r in desc if r != t][:2])
+            elif hand_rank == TWO_PAIRS:
+                if len(pairs) > 1:
+                    p1, p2 = pairs[:2]
+                    return self._pack(TWO_PAIRS, [p1, p1, p2, p2] +
+                            [r for r in desc if r != p1 and r != p2][:1])
+            elif hand_rank == ONE_PAIR:
+                if pairs:
+                    p = pairs[0]
+                    return self._pack(ONE_PAIR, [p, p] + [r for r in desc if r != p][:3])
+            elif hand_rank == HIGH_CARD:
+                return self._pack(HIGH_CARD, desc[:5])
+
+    def _build_nonflush(self, max_cards=7):
+        table = {}
+        counts = [0] * 13
+        rank_list = self._rank_values
+        def fill(i, left, key):
+            if i < 0:
+                if left < max_cards:
+                    table[key] = self._counts_value(counts)
+                return
+            rank = rank_list[i]
+            for n in xrange(0, min(4, left) + 1):
+                counts[rank] = n
+                fill(i - 1, left - n, key + n * 5 ** rank)
+            counts[rank] = 0
+        fill(len(rank_list) - 1, max_cards, 0)
+        return table
+
+    def _signature(self):
+        return (_CACHE_FORMAT, sys.byteorder, array('i').itemsize,
+                tuple(self._rank_values),
+                tuple(map(tuple, self._straight_list)), self.hand_ranks)
+
+    def _load(self):
+        """Load the tables from the cache file, return success."""
+        try:
+            with open(self.cache, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError, mmap.error):
+            return False
+        try:
+            tables = self._read_tables(data)
+        finally:
+            data.close()
+        if tables is None:
+            return False
+        self._straights, self._flush, self._mask_quinary, self._nonflush = tables
+        return True
+
+    def _read_tables(self, data):
+        """Tables in the cache file contents, None if they do not fit
+        the evaluator."""
+        if len(data) < _CACHE_HEADER.size:
+            return None
+        magic, length, count = _CACHE_HEADER.unpack_from(data)
+        offset = _CACHE_HEADER.size + length
+        if magic != _CACHE_MAGIC or len(data) < offset:
+            return None
+        try:
+            signature = marshal.loads(data[_CACHE_HEADER.size:offset])
+        except (EOFError, ValueError, TypeError):
+            return None
+        itemsize = array('i').itemsize
+        sizes = [1 << 13] * 3 + [count] * 2
+        if signature != self._signature() or \
+                len(data) != offset + sum(sizes) * itemsize:
+            return None
+        tables = []
+        for size in sizes:
+            table = array('i')
+            table.fromstring(data[offset:offset + size * itemsize])
+            offset += size * itemsize
+            tables.append(table)
+        straights, flush, mask_quinary, keys, values = tables
+        return (straights.tolist(), flush.tolist(), mask_quinary.tolist(),
+                dict(itertools.izip(keys, values)))
+
+    def _save(self):
+        """Save the tables to the cache file, atomically."""
+        temp = '%s.%d.tmp' % (self.cache, os.getpid())
+        signature = marshal.dumps(self._signature())
+        keys = sorted(self._nonflush)
+        try:
+            directory = os.path.dirname(self.cache)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(temp, 'wb') as f:
+                f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, len(signature), len(keys)))
+                f.write(signature)
+                for table in (self._straights, self._flush, self._mask_quinary,
+                        keys, [self._nonflush[key] for key in keys]):
+                    array('i', table).tofile(f)
+            os.rename(temp, self.cache)
+        except (IOError, OSError):
+            logger.warning('could not save evaluator tables to %s', self.cache)
+
+    def build(self):
+        """Build the lookup tables now instead of on first use, or
+        load them from the cache file."""
+        if self._nonflush is not None:
+            return
+        if self.cache is not None and self._load():
+            return
+        straights = [self._straight_top(mask) for mask in xrange(1 << 13)]
+        self._straights = straights
+        flush = [0] * (1 << 13)
+        for mask in xrange(1 << 13):
+            if bin(mask).count('1') < 5:
+                continue
+            top = straights[mask]
+            if top >= 0:
+                flush[mask] = self._pack(STRAIGHT_FLUSH, self._straight_values(top))
+            else:
+                flush[mask] = self._pack(FLUSH,
+                        [r for r in xrange(12, -1, -1) if mask >> r & 1][:5])
+        self._flush = flush
+        mask_quinary = [0] * (1 << 13)
+        for mask in xrange(1, 1 << 13):
+            low = mask & -mask
+            mask_quinary[mask] = mask_quinary[mask ^ low] + 5 ** (low.bit_length() - 1)
+        self._mask_quinary = mask_quinary
+        self._nonflush = self._build_nonflush()
+        if self.cache is not None:
+            self._save()
+
+    def _lookup_nonflush(self, key):
+        counts = [0] * 13
+        for r in xrange(13):
+            key, counts[r] = divmod(key, 5)
+        return self._counts_value(counts)
+
+    def evaluate(self, cards):
+        """Evaluate cards into an integer strength.
+
+        :param cards: Iterable of :class:`pokercards.cards.Card` objects
+           or a :class:`pokercards.cards.CardSet`.
+        :returns: Strength of the best hand made of the cards.
+        :rtype: int
+        """
+        if not isinstance(cards, list):
+            mask = getattr(cards, 'mask', None)
+            if mask is not None:
+                return self.evaluate_mask(mask)
+        if self._nonflush is None:
+            self.build()
+        quinary = self._quinary
+        bits = self._bits
+        masks = [0, 0, 0, 0]
+        key = 0
+        for card in cards:
+            card_id = card.id
+            key += quinary[card_id]
+            masks[card.suit_index] |= bits[card_id]
+        return self.combine(key, masks)
+
+    def combine(self, key, masks):
+        """Strength of hand given by its rank key (sum of ``5 ** rank``
+        over the cards) and list of rank masks of each suit.
+        """
+        try:
+            strength = self._nonflush[key]
+        except KeyError:
+            # more cards than the table covers
+            strength = self._nonflush[key] = self._lookup_nonflush(key)
+        flush = self._flush
+        for mask in masks:
+            if flush[mask] > strength:
+                strength = flush[mask]
+        return strength
+
+    def evaluate_mask(self, mask):
+        """Evaluate cards given as card set bitmask into an integer strength."""
+        if self._nonflush is None:
+            self.build()
+        quinary = self._mask_quinary
+        flush = self._flush
+        strength = 0
+        key = 0
+        for shift in (0, 16, 32, 48):
+            suit_mask = mask >> shift & 0x1fff
+            key += quinary[suit_mask]
+            if flush[suit_mask] > strength:
+                strength = flush[suit_mask]
+        try:
+            nonflush = self._nonflush[key]
+        except KeyError:
+            nonflush = self._nonflush[key] = self._lookup_nonflush(key)
+        return max(strength, nonflush)
+
+    def _split(self, mask):
+        """List of single card bitmasks of a card set bitmask."""
+        cards = []
+        while mask:
+            low = mask & -mask
+            cards.append(low)
+            mask ^= low
+        return cards
+
+    def evaluate_omaha(self, hole, board):
+        """Evaluate an Omaha hand, best of exactly two hole cards and
+        exactly three board cards.
+
+        :param hole: Hole cards (four for Omaha, five for PLO5), list of
+           :class:`pokercards.cards.Card` objects or a
+           :class:`pokercards.cards.CardSet`.
+        :param board: Three to five board cards.
+        :returns: Strength of the best hand.
+        :rtype: int
+        :raises: ValueError
+        """
+        masks = []
+        for cards in (hole, board):
+            mask = getattr(cards, 'mask', None)
+            if mask is None:
+                mask = 0
+                for card in cards:
+                    mask |= card.mask
+            masks.append(mask)
+        return self.evaluate_omaha_masks([masks[0]], masks[1])[0]
+
+    def evaluate_omaha_masks(self, holes, board):
+        """Evaluate Omaha hands of several players sharing a board.
+
+        The three card board combinations are prepared once. Flushes are
+        only looked at when the board holds three cards of a suit and
+        the hole cards two of the same suit.
+
+        :param holes: List of card set bitmasks of the hole cards.
+        :param board: Card set bitmask of three to five board cards.
+        :returns: List of strengths, one for each player.
+        :raises: ValueError
+        """
+        if self._nonflush is None:
+            self.build()
+        nonflush = self._nonflush
+        flush = self._flush
+        board_cards = self._split(board)
+        if not 3 <= len(board_cards) <= 5:
+            raise ValueError('evaluate_omaha(): need three to five board cards')
+        bit_quinary = self._bit_quinary
+        def key(mask):
+            return bit_quinary[mask.bit_length() - 1]
+        board_keys = set(key(a) + key(b) + key(c)
+                for a, b, c in itertools.combinations(board_cards, 3))
+        flush_shift = None
+        for shift in (0, 16, 32, 48):
+            if bin(board >> shift & 0x1fff).count('1') >= 3:
+                flush_shift = shift
+        if flush_shift is not None:
+            board_flushes = [a | b | c for a, b, c in itertools.combinations(
+                    self._split(board >> flush_shift & 0x1fff), 3)]
+        strengths = []
+        for hole in holes:
+            if hole & board:
+                raise ValueError('evaluate_omaha(): hole card on the board')
+            hole_cards = self._split(hole)
+            if len(hole_cards) < 2:
+                raise ValueError('evaluate_omaha(): need at least two hole cards')
+            hole_keys = set(key(a) + key(b)
+                    for a, b in itertools.combinations(hole_cards, 2))
+            best = max(nonflush[h + b] for h in hole_keys for b in board_keys)
+            if flush_shift is not None:
+                suited = hole >> flush_shift & 0x1fff
+                if suited & (suited - 1):
+                    for a, b in itertools.combinations(self._split(suited), 2):
+                        for triple in board_flushes:
+                            if flush[a | b | triple] > best:
+                                best = flush[a | b | triple]
+            strengths.append(best)
+        return strengths
+
+#: shared default evaluator instance, its tables are loaded from the file
+#: named by the ``POKERCARDS_TABLES`` environment variable if set
+table_evaluator = TableEvaluator(cache=os.environ.get('POKERCARDS_TABLES') or None)
+
+def warm_up(*evaluators):
+    """Build or load the tables of the evaluators now instead of on
+    first use.
+
+    :param evaluators: Evaluators to prepare, :data:`table_evaluator`
+       if none are given. Anything with a ``build()`` method will do,
+       like the evaluators of :mod:`pokercards.lowball`.
+    """
+    for evaluator in evaluators or (table_evaluator,):
+        evaluator.build()
+
+class IncrementalEvaluator(object):
+    """Evaluate a hand growing or shrinking one card at a time.
+
+    Keeps the rank key and per suit rank masks of the cards held, so
+    adding or removing a card costs a few table lookups and the
+    :attr:`strength` of the best hand is always ready, e.g. for each
+    street of a Texas Hold'em hand.
+
+    :param cards: Initial cards.
+    :param evaluator: :class:`TableEvaluator` providing the tables,
+       the shared one by default.
+    """
+
+    def __init__(self, cards=(), evaluator=None):
+        self.evaluator = evaluator if evaluator is not None else table_evaluator
+        self.evaluator.build()
+        self.cards = []
+        self.key = 0
+        self.masks = [0, 0, 0, 0]
+        self.mask = 0
+        self.strength = 0
+        for card in cards:
+            self.add(card)
+
+    def add(self, card):
+        """Add a card to the hand.
+
+        :returns: New strength of the hand.
+        :raises: ValueError if the card is already held.
+        """
+        if self.mask & card.mask:
+            raise ValueError('IncrementalEvaluator.add(): card already held')
+        evaluator = self.evaluator
+        self.mask |= card.mask
+        self.cards.append(card)
+        self.key += evaluator._quinary[card.id]
+        self.masks[card.suit_index] |= evaluator._bits[card.id]
+        self.strength = evaluator.combine(self.key, self.masks)
+        return self.strength
+
+    def remove(self, card):
+        """Remove a card from the hand.
+
+        :returns: New strength of the hand.
+        :raises: ValueError if the card is not held.
+        """
+        if not self.mask & card.mask:
+            raise ValueError('IncrementalEvaluator.remove(): card not held')
+        evaluator = self.evaluator
+        self.mask &= ~card.mask
+        self.cards.remove(card)
+        self.key -= evaluator._quinary[card.id]
+        self.masks[card.suit_index] &= ~evaluator._bits[card.id]
+        self.strength = evaluator.combine(self.key, self.masks) if self.cards else 0
+        return self.strength
+
+    @property
+    def hand_rank(self):
+        return self.evaluator.hand_ranks[self.strength >> RANK_SHIFT]
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __repr__(self):
+        return '%s([%s])' % (self.__class__.__name__,
+                ','.join(str(c) for c in self.cards))
+
+class CachedEvaluator(object):
+    """Evaluator remembering strengths of recently evaluated hands.
+
+    Wraps another evaluator and keeps up to ``maxsize`` results keyed
+    by the card set bitmask of the hand, so the order of cards does not
+    matter. The least recently used result is evicted when the cache is
+    full. Safe to share among threads. Other attributes, such as
+    :meth:`~TableEvaluator.build`, are those of the wrapped evaluator.
+
+    :param backend: Evaluator to use on a cache miss, the shared
+       :class:`TableEvaluator` by default.
+    :param maxsize: Maximum number of cached results.
+    """
+
+    def __init__(self, backend=None, maxsize=65536):
+        if maxsize < 1:
+            raise ValueError('CachedEvaluator(): maxsize must be positive')
+        self.backend = backend if backend is not None else table_evaluator
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def evaluate(self, cards):
+        """Evaluate cards into an integer strength, see
+        :meth:`TableEvaluator.evaluate`.
+        """
+        key = getattr(cards, 'mask', None)
+        if key is None:
+            key = 0
+            for card in cards:
+                key |= card.mask
+        cache = self._cache
+        with self._lock:
+            if key in cache:
+                strength = cache.pop(key)
+                cache[key] = strength
+                self.hits += 1
+                return strength
+            self.misses += 1
+        strength = self.backend.evaluate(cards)
+        with self._lock:
+            if key not in cache:
+                cache[key] = strength
+                while len(cache) > self.maxsize:
+                    cache.popitem(last=False)
+                    self.evictions += 1
+        return strength
+
+    @property
+    def hand_ranks(self):
+        return getattr(self.backend, 'hand_ranks', None)
+
+    def build(self):
+        """Build the tables of the backend, see :func:`warm_up`."""
+        self.backend.build()
+
+    def __getattr__(self, name):
+        # anything else, like evaluate_mask, comes from the backend
+        if name == 'backend':
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def clear(self):
+        """Drop all cached results and reset the counters."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return dict with ``hits``, ``misses``, ``evictions``, ``size``
+        and ``maxsize``.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._cache),
+                'maxsize': self.maxsize,
+                }
+
+    def __len__(self):
+        return len(self._cache)
+
+def main(argv=None):
+    # imported here, argparse alone takes longer to import than the module
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m pokercards.evaluator',
+            description='Precompute the standard evaluator tables.')
+    parser.add_argument('output', help='table file to write')
+    args = parser.parse_args(argv)
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    TableEvaluator(cache=args.output).build()
+    if not os.path.exists(args.output):
+        sys.stderr.write('could not write %s\n' % args.output)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,20 +20,464 @@
 # along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
 
 """
-:mod:`pokercards.games` -- Poker game
-=====================================
+:mod:`pokercards.game` -- Poker game
+====================================
 
 Manage game flow, betting rules, dealing cards, etc.
 
 """
 
 import cards
+from evaluator import table_evaluator
+
+FOLD = 0
+CHECK = 1
+CALL = 2
+RAISE = 3
+BET = RAISE
+
+PREFLOP = 0
+FLOP = 1
+TURN = 2
+RIVER = 3
+
+#: number of board cards dealt at the start of each street
+street_cards = (0, 3, 1, 1)
+
+def _popcount(mask):
+    return bin(mask).count('1')
 
 class BaseGame(object):
     """Base game class. No functionality, used only for subclassing."""
-    pass
+    __slots__ = ()
+
+class TexasGame(BaseGame):
+    """Implements No-Limit Texas Hold'em Poker variant.
+
+    The game is a state machine driven by player actions. Each call
+    returns a list of events describing what happened, as tuples
+    starting with the event name:
+
+    * ``('blind', seat, amount)`` -- seat posted a blind
+    * ``('hole', seat, cards)`` -- seat was dealt hole cards
+    * ``('action', seat, action, amount)`` -- seat acted, amount being
+      the chips put in
+    * ``('street', street, cards)`` -- board cards were dealt
+    * ``('to_act', seat, to_call, min_raise_to)`` -- waiting for seat
+    * ``('showdown', seat, strength)`` -- seat showed its hand
+    * ``('win', seat, amount)`` -- seat won chips from a pot
+    * ``('hand_over',)`` -- the hand is finished
+
+    No method blocks, so the game can be driven from any event loop
+    (e.g. an :mod:`asyncio` task reading actions from a queue and
+    passing them to :meth:`handle`). The per-table state is a handful
+    of integer lists and bitmasks of seats, so many tables fit in one
+    process.
+
+    :param stacks: Chip counts of the players, one for each seat.
+       Seats with no chips sit out.
+    :param small_blind: Small blind amount.
+    :param big_blind: Big blind amount, also the minimum bet.
+    :param button: Seat of the dealer button for the first hand.
+    :param rng: Random generator for the deck.
+    :type rng: :class:`random.Random`
+    :param seed: Seed for a new random generator, if ``rng`` is not given.
+    """
+
+    __slots__ = ('seats', 'stacks', 'bets', 'contributed', 'holes', 'board',
+            'small_blind', 'big_blind', 'button', 'deck', 'street', 'to_act',
+            'current_bet', 'min_raise', 'live', 'allin', 'pending', 'may_raise')
+
+    def __init__(self, stacks, small_blind, big_blind, button=0, rng=None,
+            seed=None):
+        if not 2 <= len(stacks) <= 22:
+            raise ValueError('TexasGame(): need two to 22 seats')
+        self.seats = len(stacks)
+        self.stacks = list(stacks)
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.button = button
+        self.deck = cards.FastDeck(rng=rng, seed=seed)
+        self.bets = [0] * self.seats
+        self.contributed = [0] * self.seats
+        self.holes = [0] * self.seats
+        self.board = []
+        self.street = None
+        self.to_act = None
+        self.current_bet = 0
+        self.min_raise = big_blind
+        self.live = 0
+        self.allin = 0
+        self.pending = 0
+        self.may_raise = 0
+
+    @property
+    def in_progress(self):
+        """True while a hand is being played."""
+        return self.street is not None
+
+    @property
+    def pot(self):
+        """Total of chips put in during the current hand."""
+        return sum(self.contributed)
+
+    def hole_cards(self, seat):
+        """List of hole cards of given seat."""
+        return list(cards.CardSet.from_mask(self.holes[seat]))
+
+    def to_call(self, seat):
+        """Chips the seat has to put in to call."""
+        return min(self.current_bet - self.bets[seat], self.stacks[seat])
+
+    def _next_seat(self, seat, mask):
+        for i in xrange(1, self.seats + 1):
+            s = (seat + i) % self.seats
+            if mask >> s & 1:
+                return s
+        return None
+
+    def _put(self, seat, amount):
+        amount = min(amount, self.stacks[seat])
+        self.stacks[seat] -= amount
+        self.bets[seat] += amount
+        self.contributed[seat] += amount
+        if not self.stacks[seat]:
+            self.allin |= 1 << seat
+        return amount
+
+    def start_hand(self):
+        """Post blinds and deal hole cards.
+
+        :returns: list of events
+        :raises: ValueError if a hand is in progress or fewer than two
+           players have chips.
+        """
+        if self.street is not None:
+            raise ValueError('TexasGame.start_hand(): hand in progress')
+        seated = 0
+        for seat in xrange(self.seats):
+            if self.stacks[seat] > 0:
+                seated |= 1 << seat
+        if _popcount(seated) < 2:
+            raise ValueError('TexasGame.start_hand(): not enough players')
+        n = self.seats
+        self.bets = [0] * n
+        self.contributed = [0] * n
+        self.holes = [0] * n
+        self.board = []
+        self.deck.reset()
+        self.live = seated
+        self.allin = 0
+        self.street = PREFLOP
+        if not seated >> self.button & 1:
+            self.button = self._next_seat(self.button, seated)
+        if _popcount(seated) == 2:
+            sb = self.button
+        else:
+            sb = self._next_seat(self.button, seated)
+        bb = self._next_seat(sb, seated)
+
+        events = [
+            ('blind', sb, self._put(sb, self.small_blind)),
+            ('blind', bb, self._put(bb, self.big_blind)),
+            ]
+        seat = self.button
+        for i in xrange(_popcount(seated)):
+            seat = self._next_seat(seat, seated)
+            hole = self.deck.deal(2)
+            self.holes[seat] = hole[0].mask | hole[1].mask
+            events.append(('hole', seat, hole))
+
+        # a short all-in big blind still has to be called in full
+        self.current_bet = max(self.big_blind, max(self.bets))
+        self.min_raise = self.big_blind
+        self.pending = self.may_raise = seated & ~self.allin
+        self.to_act = bb
+        self._advance(events)
+        return events
+
+    def handle(self, event):
+        """Apply an action given as tuple ``(seat, action[, amount])``,
+        see :meth:`act`.
+        """
+        return self.act(*event)
+
+    def act(self, seat, action, amount=0):
+        """Apply an action of the seat to act.
+
+        :param seat: Seat acting.
+        :param action: One of ``FOLD``, ``CHECK``, ``CALL``, ``BET`` or
+           ``RAISE``.
+        :param amount: For bets and raises, the total bet of the seat in
+           this betting round after the raise ("raise to").
+        :returns: list of events
+        :raises: ValueError for actions not allowed by the rules.
+        """
+        if self.street is None or seat != self.to_act:
+            raise ValueError('TexasGame.act(): not the turn of seat %s' % seat)
+        bit = 1 << seat
+        to_call = self.current_bet - self.bets[seat]
+        if action == FOLD:
+            self.live &= ~bit
+            put = 0
+        elif action == CHECK:
+            if to_call > 0:
+                raise ValueError('TexasGame.act(): can not check facing a bet')
+            put = 0
+        elif action == CALL:
+            if to_call <= 0:
+                raise ValueError('TexasGame.act(): nothing to call')
+            put = self._put(seat, to_call)
+        elif action == RAISE:
+            if not self.may_raise & bit:
+                raise ValueError('TexasGame.act(): raising is not allowed')
+            put = amount - self.bets[seat]
+            if amount <= self.current_bet or put > self.stacks[seat]:
+                raise ValueError('TexasGame.act(): invalid raise amount')
+            raise_by = amount - self.current_bet
+            if raise_by < self.min_raise and put < self.stacks[seat]:
+                raise ValueError('TexasGame.act(): raise below minimum')
+            self._put(seat, put)
+            others = self.live & ~self.allin & ~bit
+            if raise_by >= self.min_raise:
+                # full raise reopens the betting
+                self.min_raise = raise_by
+                self.may_raise = others
+            self.pending = others
+            self.current_bet = amount
+        else:
+            raise ValueError('TexasGame.act(): invalid action')
+        self.pending &= ~bit
+        self.may_raise &= ~bit
+        events = [('action', seat, action, put)]
+        self._advance(events)
+        return events
+
+    def _advance(self, events):
+        """Move to the next seat, street or showdown."""
+        live = self.live
+        if _popcount(live) == 1:
+            self._award([(self.pot, live)], events)
+            return
+        can_act = live & ~self.allin
+        pending = self.pending & can_act
+        if pending and _popcount(can_act) == 1 \
+                and self.bets[self._next_seat(self.to_act, pending)] >= max(self.bets):
+            # everybody else is all-in and the bet is matched
+            pending = 0
+        if pending:
+            seat = self._next_seat(self.to_act, pending)
+            self.to_act = seat
+            events.append(('to_act', seat, self.to_call(seat),
+                self.current_bet + self.min_raise))
+            return
+        # betting round is over
+        self.bets = [0] * self.seats
+        self.current_bet = 0
+        self.min_raise = self.big_blind
+        while self.street < RIVER:
+            self.street += 1
+            self.deck.discard()
+            dealt = self.deck.deal(street_cards[self.street])
+            self.board.extend(dealt)
+            events.append(('street', self.street, dealt))
+            if _popcount(can_act) > 1:
+                self.pending = self.may_raise = can_act
+                self.to_act = self._next_seat(self.button, can_act)
+                events.append(('to_act', self.to_act, 0, self.big_blind))
+                return
+        self._showdown(events)
+
+    def _showdown(self, events):
+        board = 0
+        for card in self.board:
+            board |= card.mask
+        holes = [self.holes[seat] if self.live >> seat & 1 else None
+                for seat in xrange(self.seats)]
+        won, strengths = _settle(holes, board, self.contributed, self.button)
+        for seat in xrange(self.seats):
+            if holes[seat] is not None:
+                events.append(('showdown', seat, strengths[seat]))
+        self._finish(won, events)
+
+    def _award(self, pots, events):
+        """Pay out pots given as (amount, mask of winners) without
+        a showdown."""
+        won = [0] * self.seats
+        for amount, winners in pots:
+            _split(amount, winners, self.button, won)
+        self._finish(won, events)
+
+    def _finish(self, won, events):
+        for seat in xrange(self.seats):
+            if won[seat]:
+                self.stacks[seat] += won[seat]
+                events.append(('win', seat, won[seat]))
+        self.street = None
+        self.to_act = None
+        seated = 0
+        for seat in xrange(self.seats):
+            if self.stacks[seat] > 0:
+                seated |= 1 << seat
+        if seated:
+            self.button = self._next_seat(self.button, seated)
+        events.append(('hand_over',))
+
+def _split(amount, winners, button, won):
+    """Split amount among seats in winners mask. Odd chips go one each
+    to the winners first after the button."""
+    count = _popcount(winners)
+    share, odd = divmod(amount, count)
+    seats = len(won)
+    for i in xrange(1, seats + 1):
+        seat = (button + i) % seats
+        if winners >> seat & 1:
+            won[seat] += share
+            if odd:
+                won[seat] += 1
+                odd -= 1
+
+def _pots(contributed, live):
+    """Split contributions into main and side pots.
+
+    :returns: list of (amount, mask of eligible seats)
+    """
+    seats = len(contributed)
+    levels = sorted(set(contributed[s] for s in xrange(seats)
+        if live >> s & 1 and contributed[s]))
+    pots = []
+    previous = 0
+    for i, level in enumerate(levels):
+        if i == len(levels) - 1:
+            # the top pot takes all remaining chips, including those
+            # of folded players who put in more than any live one
+            level = max(contributed)
+        amount = 0
+        eligible = 0
+        for seat in xrange(seats):
+            c = contributed[seat]
+            amount += min(c, level) - min(c, previous)
+            if live >> seat & 1 and c >= level:
+                eligible |= 1 << seat
+        if not eligible:
+            eligible = pots[-1][1] if pots else live
+        if pots and pots[-1][1] == eligible:
+            pots[-1] = (pots[-1][0] + amount, eligible)
+        else:
+            pots.append((amount, eligible))
+        previous = level
+    return pots
+
+def _settle(holes, board, contributed, button):
+    """Evaluate hands given as card set masks (None for folded seats)
+    and pay out all pots. Returns (won, strengths) lists."""
+    seats = len(holes)
+    evaluate = table_evaluator.evaluate_mask
+    strengths = [0] * seats
+    live = 0
+    for seat in xrange(seats):
+        if holes[seat] is not None:
+            strengths[seat] = evaluate(board | holes[seat])
+            live |= 1 << seat
+    ranked = sorted((seat for seat in xrange(seats) if live >> seat & 1),
+            key=strengths.__getitem__, reverse=True)
+    won = [0] * seats
+    for amount, eligible in _pots(contributed, live):
+        winners = 0
+        best = None
+        for seat in ranked:
+            if eligible >> seat & 1:
+                if best is None:
+                    best = strengths[seat]
+                elif strengths[seat] != best:
+                    break
+                winners |= 1 << seat
+        _split(amount, winners, button, won)
+    return won, strengths
+
+def resolve_showdown(holes, board, contributions, button=0):
+    """Settle a showdown with main and side pots.
+
+    Every hand is evaluated once, then each pot, from the main pot up,
+    goes to the strongest hands eligible for it. Split pots are divided
+    evenly and the odd chips go one each to the winners sitting first
+    after the button. Chips put in beyond what any other player covered
+    are returned as a pot only their owner is eligible for.
+
+    :param holes: Hole cards for each seat (list of
+       :class:`pokercards.cards.Card` objects or
+       :class:`pokercards.cards.CardSet`), ``None`` for folded seats.
+    :param board: Five board cards.
+    :param contributions: Chips each seat put in the pot during the hand,
+       including folded seats.
+    :param button: Seat of the dealer button.
+    :returns: tuple (won, strengths) of lists with chips won and hand
+       strength of each seat (0 for folded seats).
+    :raises: ValueError
+    """
+    if len(holes) != len(contributions):
+        raise ValueError('resolve_showdown(): need contribution of each seat')
+    masks = [None if hole is None else cards.CardSet(hole).mask for hole in holes]
+    live = [mask for mask in masks if mask is not None]
+    if not live:
+        raise ValueError('resolve_showdown(): no hand to show')
+    return _settle(masks, cards.CardSet(board).mask, list(contributions), button)
+
+def _best_seats(strengths, eligible):
+    """Mask of the eligible seats with the highest non-zero strength."""
+    winners = 0
+    best = 0
+    for seat, strength in enumerate(strengths):
+        if not eligible >> seat & 1 or not strength or strength < best:
+            continue
+        if strength > best:
+            best = strength
+            winners = 0
+        winners |= 1 << seat
+    return winners
+
+def resolve_hilo_showdown(high, low, contributions, button=0):
+    """Settle a split pot showdown with main and side pots.
+
+    Each pot is split in halves between the best high and the best low
+    hands eligible for it, the odd chip going to the high half. If no
+    eligible hand qualifies for low, the high hands take the whole pot.
+    Within a half the chips are split like in :func:`resolve_showdown`.
+
+    Strengths come from any evaluators, e.g. for Omaha Hi-Lo
+    :meth:`pokercards.evaluator.TableEvaluator.evaluate_omaha_masks` and
+    :meth:`pokercards.lowball.AceFiveEvaluator.evaluate_omaha_masks`.
 
-class TexasGame(object):
-    """Iplements Texas Hold'em Poker variant"""
-    # TODO
-    pass
+    :param high: High strength of each seat, ``None`` for folded seats.
+    :param low: Low strength of each seat, 0 or ``None`` if the hand
+       does not qualify or folded.
+    :param contributions: Chips each seat put in the pot during the hand,
+       including folded seats.
+    :param button: Seat of the dealer button.
+    :returns: List of chips won by each seat.
+    :raises: ValueError
+    """
+    seats = len(high)
+    if len(low) != seats or len(contributions) != seats:
+        raise ValueError('resolve_hilo_showdown(): need high, low and '
+                'contribution of each seat')
+    live = 0
+    for seat in xrange(seats):
+        if high[seat] is not None:
+            live |= 1 << seat
+    if not live:
+        raise ValueError('resolve_hilo_showdown(): no hand to show')
+    high = [strength or 0 for strength in high]
+    low = [(strength or 0) if live >> seat & 1 else 0
+            for seat, strength in enumerate(low)]
+    won = [0] * seats
+    for amount, eligible in _pots(list(contributions), live):
+        high_winners = _best_seats(high, eligible)
+        low_winners = _best_seats(low, eligible)
+        if low_winners:
+            low_half = amount // 2
+            _split(amount - low_half, high_winners, button, won)
+            _split(low_half, low_winners, button, won)
+        else:
+            _split(amount, high_winners, button, won)
+    return won
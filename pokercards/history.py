@@ -0,0 +1,195 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.history` -- Hand history replay
+================================================
+
+Evaluate the showdowns of large hand history logs as a stream, with
+memory bounded by the batch size regardless of the size of the log::
+
+    for result in evaluate_stream(read_lines('hands.log')):
+        if result.winners != expected[result.hand_id]:
+            ...
+
+The default line format is whitespace separated fields: hand id, board
+and the hole cards of each player, cards written together, e.g.::
+
+    1234 AsKd7c2h9s QhQd 7s6s
+
+Empty lines and lines starting with ``#`` are skipped. Other formats
+can be read by passing a different ``parse`` function; it must be a
+module level function so it can be sent to worker processes.
+"""
+
+import mmap
+import multiprocessing
+from collections import deque, namedtuple
+
+from const import ranks, suits
+from evaluator import table_evaluator
+
+#: Result of one hand: the hand id, strength of each player's best hand
+#: (as :attr:`pokercards.cards.PokerHand.strength`) and the list of
+#: indexes of the players with the best hand.
+HandResult = namedtuple('HandResult', 'hand_id strengths winners')
+
+# card set bitmask of each two character card, either case
+_card_masks = {}
+for _i, _suit in enumerate(suits):
+    for _j, _rank in enumerate(ranks):
+        _mask = 1 << (16 * _i + len(ranks) - 1 - _j)
+        for _text in (_rank + _suit, _rank + _suit.lower(),
+                _rank.lower() + _suit.lower()):
+            _card_masks[_text] = _mask
+del _i, _j, _suit, _rank, _mask, _text
+
+def parse_cards(text):
+    """Card set bitmask of cards written together, like ``AsKd7c``.
+
+    :raises: ValueError
+    """
+    mask = 0
+    try:
+        for i in xrange(0, len(text), 2):
+            card = _card_masks[text[i:i + 2]]
+            if mask & card:
+                raise ValueError('parse_cards(): duplicate card %s' % text[i:i + 2])
+            mask |= card
+    except KeyError:
+        raise ValueError('parse_cards(): invalid card %s' % text[i:i + 2])
+    return mask
+
+def parse_line(line):
+    """Parse a line of the default format.
+
+    :returns: Tuple (hand id, board mask, list of hole card masks) or
+       ``None`` for lines to skip.
+    :raises: ValueError
+    """
+    fields = line.split()
+    if not fields or fields[0].startswith('#'):
+        return None
+    if len(fields) < 4:
+        raise ValueError('parse_line(): need hand id, board and two hands')
+    return fields[0], parse_cards(fields[1]), [parse_cards(f) for f in fields[2:]]
+
+def read_lines(source, use_mmap=False):
+    """Iterate over lines of a log.
+
+    :param source: File name or an open file object.
+    :param use_mmap: Memory map the file instead of buffered reading.
+    """
+    if not isinstance(source, basestring):
+        for line in source:
+            yield line
+        return
+    with open(source, 'rb') as f:
+        if not use_mmap:
+            for line in f:
+                yield line
+            return
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file can not be mapped
+            return
+        try:
+            for line in iter(data.readline, b''):
+                yield line
+        finally:
+            data.close()
+
+def _batches(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _evaluate_lines(args):
+    """Parse and evaluate a batch of lines, return list of results."""
+    lines, parse = args
+    evaluate = table_evaluator.evaluate_mask
+    results = []
+    for line in lines:
+        parsed = parse(line)
+        if parsed is None:
+            continue
+        hand_id, board, holes = parsed
+        strengths = []
+        for hole in holes:
+            if hole & board:
+                raise ValueError('evaluate_stream(): hand %s has a card '
+                        'on the board' % hand_id)
+            strengths.append(evaluate(board | hole))
+        best = max(strengths)
+        results.append(HandResult(hand_id, strengths,
+                [i for i, s in enumerate(strengths) if s == best]))
+    return results
+
+def evaluate_stream(lines, parse=parse_line, batch_size=1000, processes=1,
+        pool=None):
+    """Evaluate showdowns of a stream of hand history lines.
+
+    Lines are consumed lazily in batches of ``batch_size``. With worker
+    processes at most two batches per process are in flight, results
+    are yielded in the order of the input.
+
+    :param lines: Iterable of lines, e.g. from :func:`read_lines`.
+    :param parse: Function parsing a line, see :func:`parse_line`.
+    :param batch_size: Number of lines parsed and evaluated at once.
+    :param processes: Number of worker processes, 1 runs in the
+       calling process, ``None`` uses all CPUs.
+    :param pool: Existing :class:`multiprocessing.pool.Pool` to use
+       instead of starting a new one.
+    :returns: Iterator of :class:`HandResult`.
+    :raises: ValueError from parsing or on a hole card also on the board.
+    """
+    table_evaluator.build()
+    batches = ((batch, parse) for batch in _batches(lines, batch_size))
+    if processes == 1 and pool is None:
+        for args in batches:
+            for result in _evaluate_lines(args):
+                yield result
+        return
+
+    own_pool = pool is None
+    if own_pool:
+        pool = multiprocessing.Pool(processes)
+    try:
+        width = 2 * (processes or multiprocessing.cpu_count())
+        pending = deque()
+        for args in batches:
+            pending.append(pool.apply_async(_evaluate_lines, (args,)))
+            if len(pending) >= width:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        if own_pool:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,146 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.isomorphism` -- Suit isomorphism
+=================================================
+
+Poker hands do not depend on the names of the suits, so situations which
+differ only by relabelling the suits, like ``AhKh`` and ``AsKs`` on a
+rainbow board, have the same outcomes. The functions here map a
+situation, given as a sequence of card groups (e.g. hole cards, board,
+dead cards), to a canonical form shared by all of its suit relabellings::
+
+    (hole, board), perm = canonicalize(hole, board)
+
+Groups are compared as sets, the order of cards within a group does not
+matter, but the order of the groups does.
+"""
+
+import math
+import itertools
+
+from cards import Card, CardSet
+
+SUIT_COUNT = 4
+_SUIT_BITS = 0x1fff
+
+def _signatures(masks):
+    """Tuple of the rank masks in each group for every suit."""
+    return [tuple(mask >> 16 * suit & _SUIT_BITS for mask in masks)
+            for suit in xrange(SUIT_COUNT)]
+
+def permute_mask(mask, perm):
+    """Relabel suits of a card set bitmask.
+
+    :param mask: Card set bitmask.
+    :param perm: Tuple giving the new suit index for each suit index.
+    """
+    result = 0
+    for suit in xrange(SUIT_COUNT):
+        result |= (mask >> 16 * suit & _SUIT_BITS) << 16 * perm[suit]
+    return result
+
+def canonical_masks(masks):
+    """Canonical form of a situation given as card set bitmasks.
+
+    Suits are ordered by the ranks they hold in the first group, ties
+    broken by the following groups, and the highest ordered suit gets
+    index 0.
+
+    :param masks: Sequence of card set bitmasks, one per group.
+    :returns: Tuple (canonical masks, permutation) where the permutation
+       is a tuple giving the new suit index for each suit index, as
+       accepted by :func:`permute_mask`.
+    """
+    signatures = _signatures(masks)
+    order = sorted(xrange(SUIT_COUNT), key=signatures.__getitem__, reverse=True)
+    perm = [0] * SUIT_COUNT
+    for new, old in enumerate(order):
+        perm[old] = new
+    perm = tuple(perm)
+    return tuple(permute_mask(mask, perm) for mask in masks), perm
+
+def canonicalize(*groups):
+    """Canonical form of a situation given as groups of cards.
+
+    :param groups: Lists of :class:`pokercards.cards.Card` objects or
+       :class:`pokercards.cards.CardSet` objects, e.g. hole cards and
+       board.
+    :returns: Tuple (groups, permutation) of the canonical groups as
+       lists of cards and the suit permutation used, see
+       :func:`canonical_masks`.
+    """
+    masks, perm = canonical_masks([CardSet(group).mask for group in groups])
+    return [CardSet.from_mask(mask).to_list() for mask in masks], perm
+
+def permute_cards(cards, perm):
+    """Relabel suits of a list of cards, keeping their order."""
+    by_bit = Card._by_bit
+    return [by_bit[16 * perm[card.suit_index] + card.rank_value] for card in cards]
+
+def interchangeable_suits(masks):
+    """Group suits which play the same role in all given masks.
+
+    :returns: List of tuples of suit indexes, only groups of two or
+       more suits are listed.
+    """
+    classes = {}
+    for suit, signature in enumerate(_signatures(masks)):
+        classes.setdefault(signature, []).append(suit)
+    return [tuple(suits) for suits in classes.values() if len(suits) > 1]
+
+def orbit_size(masks):
+    """Number of distinct situations isomorphic to the given one,
+    including itself."""
+    size = math.factorial(SUIT_COUNT)
+    for suits in interchangeable_suits(masks):
+        size //= math.factorial(len(suits))
+    return size
+
+def canonical_boards(size, masks=()):
+    """Enumerate boards up to suit isomorphism.
+
+    :param size: Number of board cards.
+    :param masks: Card set bitmasks of the known groups which the board
+       is added to, their cards are not dealt.
+    :returns: List of tuples (board mask, count), one for each class of
+       isomorphic boards in the order they were first found, with the
+       number of boards in the class. Counts sum to the number of all
+       boards.
+    """
+    masks = tuple(masks)
+    known = 0
+    for mask in masks:
+        known |= mask
+    stub = [card.mask for card in Card._by_id if not card.mask & known]
+    counts = {}
+    boards = []
+    for cards in itertools.combinations(stub, size):
+        board = 0
+        for mask in cards:
+            board |= mask
+        key = canonical_masks(masks + (board,))[0]
+        if key not in counts:
+            counts[key] = 0
+            boards.append((key, board))
+        counts[key] += 1
+    return [(board, counts[key]) for key, board in boards]
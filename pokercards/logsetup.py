@@ -20,9 +20,11 @@
 # along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import logging.handlers
 from logging import DEBUG, INFO, WARNING, ERROR
 
 from const import __version__
+import cards
 
 """Convenience functions for setting up simple logging scenarios."""
 
@@ -35,6 +37,7 @@ def setup_server_logging(name='', logfile='', maxBytes=524288, backupCount=1, le
     formatter = logging.Formatter(fmt)
     ch.setFormatter(formatter)
     logger.addHandler(ch)
+    cards.update_trace()
     return logger
 
 def setup_console_logging(name='', level=logging.DEBUG,
@@ -47,5 +50,14 @@ def setup_console_logging(name='', level=logging.DEBUG,
     formatter = logging.Formatter(fmt)
     ch.setFormatter(formatter)
     logger.addHandler(ch)
+    cards.update_trace()
     return logger
 
+def enable_trace(name=cards.trace_logger.name, enabled=True):
+    """Enable or disable hand evaluation trace events.
+
+    Sets level of the given trace logger and updates the flag checked
+    during evaluation, see :func:`pokercards.cards.update_trace`.
+    """
+    logging.getLogger(name).setLevel(logging.DEBUG if enabled else logging.INFO)
+    return cards.update_trace()
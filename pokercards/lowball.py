@@ -0,0 +1,263 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.lowball` -- Low hand evaluation
+================================================
+
+Table driven evaluation of low hands into integer strengths which, like
+:attr:`pokercards.cards.PokerHand.strength`, compare higher for the
+better hand.
+
+* Ace-to-five (Razz, the low half of Omaha and Stud Hi-Lo): aces are
+  low, straights and flushes do not count, the best low is ``5-4-3-2-A``.
+* Deuce-to-seven (2-7 lowball): aces are high, straights and flushes
+  count against the hand, the best low is ``7-5-4-3-2``.
+
+Strengths of low hands are ``LOW_BASE`` minus a packed value laid out
+like the high strengths of :mod:`pokercards.evaluator`, with the hand
+rank (0 for no pair up to 5 for four of a kind in ace-to-five) and the
+card ranks in order of significance, the highest card first. For
+ace-to-five the card ranks count the ace as 0.
+
+Hands not qualifying for a low (see the ``qualifier`` parameters) have
+strength 0.
+"""
+
+import itertools
+
+from evaluator import TableEvaluator, pack, rank_values
+
+#: strengths of low hands are this minus the packed hand
+LOW_BASE = 1 << 24
+
+def _low_values(counts):
+    """Packed ace-to-five value of ranks counts, lower is better."""
+    groups = sorted(((n, v) for v, n in enumerate(counts) if n), reverse=True)
+    pattern = [n for n, v in groups]
+    if pattern[0] == 4:
+        hand_rank = 5
+    elif pattern[0] == 3:
+        hand_rank = 4 if len(pattern) > 1 and pattern[1] >= 2 else 3
+    elif pattern[0] == 2:
+        hand_rank = 2 if len(pattern) > 1 and pattern[1] == 2 else 1
+    else:
+        hand_rank = 0
+    values = []
+    for n, v in groups:
+        values.extend([v] * n)
+    return pack(hand_rank, values)
+
+def _best_low(counts):
+    """Packed value of the best ace-to-five low of at most five of the
+    counted cards."""
+    total = sum(counts)
+    if total <= 5:
+        return _low_values(counts)
+    distinct = [v for v in xrange(13) if counts[v]]
+    if len(distinct) >= 5:
+        return pack(0, distinct[4::-1])
+    # not enough ranks for a no pair low, pair up as little and as low
+    # as possible
+    picked = [0] * 13
+    for v in distinct:
+        picked[v] = 1
+    paired = [v for v in distinct if counts[v] >= 2]
+    if len(distinct) == 4:
+        picked[paired[0]] = 2
+    elif len(distinct) == 3:
+        if len(paired) >= 2:
+            picked[paired[0]] = picked[paired[1]] = 2
+        else:
+            picked[paired[0]] = 3
+    else:
+        low, high = distinct
+        if counts[low] >= 3 and counts[high] >= 2:
+            picked[low], picked[high] = 3, 2
+        elif counts[high] >= 3 and counts[low] >= 2:
+            picked[low], picked[high] = 2, 3
+        else:
+            picked[paired[0]] = 4
+    return _low_values(picked)
+
+def _threshold(qualifier):
+    """Strength of the worst no pair low with the qualifier high."""
+    if qualifier is None:
+        return 0
+    top = (rank_values[qualifier] + 1) % 13
+    if top < 4:
+        raise ValueError('qualifier %s is below five' % qualifier)
+    return LOW_BASE - pack(0, range(top, top - 5, -1))
+
+class AceFiveEvaluator(object):
+    """Evaluate ace-to-five low hands using precomputed lookup tables.
+
+    The best low of up to seven cards is looked up by a key summing
+    ``5 ** rank`` over the cards, ace counting as the lowest rank. The
+    tables are built on first use.
+    """
+
+    def __init__(self):
+        self._table = None
+        self._mask_quinary = None
+        # per card set bit, ace low ranks
+        self._bit_quinary = [5 ** (((bit & 15) + 1) % 13) for bit in xrange(64)]
+
+    def build(self):
+        """Build the lookup tables now instead of on first use."""
+        if self._table is not None:
+            return
+        mask_quinary = [0] * (1 << 13)
+        for mask in xrange(1, 1 << 13):
+            low = mask & -mask
+            mask_quinary[mask] = mask_quinary[mask ^ low] + \
+                    self._bit_quinary[low.bit_length() - 1]
+        self._mask_quinary = mask_quinary
+        table = {}
+        counts = [0] * 13
+        def fill(rank, left, key):
+            if rank < 0:
+                if left < 7:
+                    table[key] = LOW_BASE - _best_low(counts)
+                return
+            for n in xrange(0, min(4, left) + 1):
+                counts[rank] = n
+                fill(rank - 1, left - n, key + n * 5 ** rank)
+            counts[rank] = 0
+        fill(12, 7, 0)
+        self._table = table
+
+    def evaluate(self, cards, qualifier=None):
+        """Evaluate cards into a low strength.
+
+        :param cards: Up to seven cards, list of
+           :class:`pokercards.cards.Card` objects or a
+           :class:`pokercards.cards.CardSet`.
+        :param qualifier: Highest rank allowed for a low, e.g. ``'8'``
+           for eight or better. Hands with a pair or a higher card
+           do not qualify.
+        :returns: Strength of the best low, 0 if it does not qualify.
+        :raises: ValueError
+        """
+        mask = getattr(cards, 'mask', None)
+        if mask is None:
+            mask = 0
+            for card in cards:
+                mask |= card.mask
+        return self.evaluate_mask(mask, qualifier)
+
+    def evaluate_mask(self, mask, qualifier=None):
+        """Evaluate cards given as card set bitmask into a low strength.
+
+        :raises: ValueError for more than seven cards
+        """
+        if self._table is None:
+            self.build()
+        quinary = self._mask_quinary
+        try:
+            strength = self._table[quinary[mask & 0x1fff] + quinary[mask >> 16 & 0x1fff]
+                    + quinary[mask >> 32 & 0x1fff] + quinary[mask >> 48 & 0x1fff]]
+        except KeyError:
+            raise ValueError('AceFiveEvaluator.evaluate(): at most seven cards')
+        return strength if strength >= _threshold(qualifier) else 0
+
+    def evaluate_omaha_masks(self, holes, board, qualifier='8'):
+        """Evaluate Omaha low hands, best of exactly two hole cards and
+        exactly three board cards.
+
+        :param holes: List of card set bitmasks of the hole cards.
+        :param board: Card set bitmask of three to five board cards.
+        :param qualifier: See :meth:`evaluate`.
+        :returns: List of low strengths, one for each player.
+        """
+        if self._table is None:
+            self.build()
+        table = self._table
+        bit_quinary = self._bit_quinary
+        def split(mask):
+            keys = []
+            while mask:
+                low = mask & -mask
+                keys.append(bit_quinary[low.bit_length() - 1])
+                mask ^= low
+            return keys
+        board_keys = set(a + b + c for a, b, c in
+                itertools.combinations(split(board), 3))
+        threshold = _threshold(qualifier)
+        strengths = []
+        for hole in holes:
+            best = 0
+            for a, b in set(itertools.combinations(split(hole), 2)):
+                for key in board_keys:
+                    if table[a + b + key] > best:
+                        best = table[a + b + key]
+            strengths.append(best if best >= threshold else 0)
+        return strengths
+
+class DeuceSevenEvaluator(object):
+    """Evaluate deuce-to-seven low hands.
+
+    Five cards are looked up in high hand tables without the wheel
+    straight and the strength inverted. Of more cards, the best five
+    card low is taken.
+    """
+
+    def __init__(self):
+        self._high = TableEvaluator(ace_low=False)
+
+    def build(self):
+        """Build the lookup tables now instead of on first use."""
+        self._high.build()
+
+    def evaluate(self, cards):
+        """Evaluate cards into a low strength.
+
+        :param cards: List of :class:`pokercards.cards.Card` objects or
+           a :class:`pokercards.cards.CardSet`.
+        :returns: Strength of the best low.
+        """
+        mask = getattr(cards, 'mask', None)
+        if mask is None:
+            mask = 0
+            for card in cards:
+                mask |= card.mask
+        return self.evaluate_mask(mask)
+
+    def evaluate_mask(self, mask):
+        """Evaluate cards given as card set bitmask into a low strength.
+
+        :raises: ValueError for more than seven cards
+        """
+        evaluate = self._high.evaluate_mask
+        if bin(mask).count('1') <= 5:
+            return LOW_BASE - evaluate(mask)
+        cards = []
+        while mask:
+            low = mask & -mask
+            cards.append(low)
+            mask ^= low
+        return LOW_BASE - min(evaluate(a | b | c | d | e)
+                for a, b, c, d, e in itertools.combinations(cards, 5))
+
+#: shared ace-to-five evaluator instance
+ace_five_evaluator = AceFiveEvaluator()
+#: shared deuce-to-seven evaluator instance
+deuce_seven_evaluator = DeuceSevenEvaluator()
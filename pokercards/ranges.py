@@ -0,0 +1,217 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.ranges` -- Hand ranges
+=======================================
+
+Parse Texas Hold'em hand ranges such as ``"QQ+, AKs, A5s-A2s, KQo"``
+into sets of hole card combinations.
+
+Each of the 1326 possible two-card combinations has an index into the
+precomputed :data:`combos` and :data:`combo_masks` tables, and a range
+is a mapping of combination indexes to weights.
+
+Supported notation, tokens separated by commas or spaces:
+
+* ``AA``, ``AKs``, ``AKo``, ``AK`` -- a pair, suited, offsuit or any
+  combination of the two ranks
+* ``QQ+``, ``ATs+`` -- the pair and all higher pairs, or the hand with
+  all higher kickers up to the rank below the top card
+* ``99-66``, ``A5s-A2s`` -- all hands between the two inclusive
+* ``AsKs`` -- one specific combination
+* ``AKs:0.5`` -- any of the above with a weight (default 1)
+"""
+
+import re
+
+from const import ranks
+from cards import Card, CardSet
+
+#: all two-card combinations as (card, card) tuples, lower card id first
+combos = []
+#: card set bitmask of each combination in :data:`combos`
+combo_masks = []
+#: index into :data:`combos` for each combination mask
+combo_index = {}
+#: combination indexes of each of the 169 starting hand classes
+#: (``'AA'``, ``'AKs'``, ``'AKo'``, ...)
+class_combos = {}
+
+def _build():
+    deck = Card._by_id
+    for i in xrange(len(deck)):
+        for j in xrange(i + 1, len(deck)):
+            a, b = deck[i], deck[j]
+            mask = a.mask | b.mask
+            combo_index[mask] = len(combos)
+            combos.append((a, b))
+            combo_masks.append(mask)
+            high, low = (a, b) if a.rank_value >= b.rank_value else (b, a)
+            if high.rank == low.rank:
+                name = high.rank + low.rank
+            elif high.suit == low.suit:
+                name = high.rank + low.rank + 's'
+            else:
+                name = high.rank + low.rank + 'o'
+            class_combos.setdefault(name, []).append(combo_index[mask])
+
+_build()
+
+def hand_classes():
+    """List of the 169 starting hand class names, from ``AA`` down."""
+    names = []
+    for i, high in enumerate(ranks):
+        for j, low in enumerate(ranks):
+            if i == j:
+                names.append(high + low)
+            elif i < j:
+                names.append(high + low + 's')
+                names.append(high + low + 'o')
+    return names
+
+_class_re = re.compile(r'^([AKQJT2-9])([AKQJT2-9])([SO]?)$')
+_combo_re = re.compile(r'^([AKQJT2-9][SHDC])([AKQJT2-9][SHDC])$')
+
+def _class_names(high, low, kind):
+    """Class names for ranks high, low and kind '', 's' or 'o'."""
+    if high == low:
+        return [high + low]
+    kinds = [kind] if kind else ['s', 'o']
+    return [high + low + k for k in kinds]
+
+def _parse_token(token):
+    """Return list of combination indexes described by token."""
+    match = _combo_re.match(token)
+    if match:
+        mask = Card(match.group(1)).mask | Card(match.group(2)).mask
+        if mask not in combo_index:
+            raise ValueError('Range(): invalid combination %s' % token)
+        return [combo_index[mask]]
+    if token.endswith('+'):
+        match = _class_re.match(token[:-1])
+        if not match:
+            raise ValueError('Range(): invalid token %s' % token)
+        high, low, kind = match.groups()
+        hi, lo = ranks.index(high), ranks.index(low)
+        if hi > lo:
+            raise ValueError('Range(): higher rank must come first in %s' % token)
+        if hi == lo:
+            spans = [(ranks[r], ranks[r]) for r in xrange(0, hi + 1)]
+        else:
+            spans = [(high, ranks[r]) for r in xrange(hi + 1, lo + 1)]
+    elif '-' in token:
+        first, last = token.split('-', 1)
+        m1, m2 = _class_re.match(first), _class_re.match(last)
+        if not m1 or not m2 or m1.group(3) != m2.group(3):
+            raise ValueError('Range(): invalid token %s' % token)
+        (h1, l1, kind), (h2, l2, _) = m1.groups(), m2.groups()
+        i1, j1, i2, j2 = [ranks.index(r) for r in (h1, l1, h2, l2)]
+        if i1 == j1 and i2 == j2:
+            spans = [(ranks[r], ranks[r]) for r in xrange(min(i1, i2), max(i1, i2) + 1)]
+        elif i1 == i2 and i1 < j1 and i1 < j2:
+            spans = [(h1, ranks[r]) for r in xrange(min(j1, j2), max(j1, j2) + 1)]
+        else:
+            raise ValueError('Range(): invalid span %s' % token)
+    else:
+        match = _class_re.match(token)
+        if not match:
+            raise ValueError('Range(): invalid token %s' % token)
+        high, low, kind = match.groups()
+        if ranks.index(high) > ranks.index(low):
+            high, low = low, high
+        spans = [(high, low)]
+    indexes = []
+    for high, low in spans:
+        for name in _class_names(high, low, kind.lower()):
+            indexes.extend(class_combos[name])
+    return indexes
+
+class Range(object):
+    """Weighted set of hole card combinations.
+
+    :param text: Range in the notation described in
+       :mod:`pokercards.ranges`.
+    :raises: ValueError
+
+    .. attribute:: weights
+
+       Dict mapping combination index (see :data:`combos`) to weight.
+    """
+
+    __slots__ = ('weights',)
+
+    def __init__(self, text=''):
+        self.weights = {}
+        for token in re.split(r'[,\s]+', text.strip()):
+            if not token:
+                continue
+            weight = 1.0
+            if ':' in token:
+                token, weight = token.split(':', 1)
+                weight = float(weight)
+                if weight < 0:
+                    raise ValueError('Range(): negative weight')
+            for index in _parse_token(token.upper()):
+                if weight:
+                    self.weights[index] = weight
+                else:
+                    self.weights.pop(index, None)
+
+    @classmethod
+    def from_weights(cls, weights):
+        """Create a range from dict of combination index to weight."""
+        r = cls()
+        r.weights = dict(weights)
+        return r
+
+    def remove_dead(self, dead):
+        """Return a new range without combinations containing any of
+        the dead cards.
+
+        :param dead: List of :class:`pokercards.cards.Card` objects or
+           a :class:`pokercards.cards.CardSet`.
+        """
+        dead_mask = CardSet(dead).mask
+        return Range.from_weights((i, w) for i, w in self.weights.items()
+                if not combo_masks[i] & dead_mask)
+
+    def masks(self):
+        """Return tuple (masks, weights) of parallel lists of combination
+        card set bitmasks and weights, in combination index order."""
+        indexes = sorted(self.weights)
+        return ([combo_masks[i] for i in indexes],
+                [self.weights[i] for i in indexes])
+
+    def __iter__(self):
+        """Iterate over (card, card, weight) tuples."""
+        for index in sorted(self.weights):
+            a, b = combos[index]
+            yield a, b, self.weights[index]
+
+    def __len__(self):
+        return len(self.weights)
+
+    def __contains__(self, hole):
+        return combo_index.get(CardSet(hole).mask) in self.weights
+
+    def __repr__(self):
+        return '%s(%d combos)' % (self.__class__.__name__, len(self.weights))
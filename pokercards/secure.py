@@ -0,0 +1,154 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.secure` -- Secure shuffling
+============================================
+
+Random generator drawing from the operating system CSPRNG and helpers
+to store deck orders compactly, e.g. for auditing real money games::
+
+    deck = Deck(rng=SecureRandom())
+    record = deck.shuffle()
+    # later, to replay
+    deck = Deck.from_record(record)
+"""
+
+import os
+import random
+import binascii
+
+class SecureRandom(random.Random):
+    """Random generator using :func:`os.urandom`.
+
+    Entropy is read from the operating system in blocks of
+    ``buffer_size`` bytes instead of one system call per number. Integers
+    below a bound, and so shuffles, are drawn by rejection sampling and
+    have no modulo or floating point bias.
+
+    Like :class:`random.SystemRandom`, the generator can not be seeded
+    and has no state to save or restore.
+
+    :param buffer_size: Number of bytes read from the system at once.
+    """
+
+    def __init__(self, buffer_size=4096):
+        self._buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._pos = 0
+        random.Random.__init__(self)
+
+    def _bytes(self, count):
+        if self._pos + count > len(self._buffer):
+            rest = self._buffer[self._pos:]
+            self._buffer = rest + bytearray(os.urandom(max(self._buffer_size, count)))
+            self._pos = 0
+        start = self._pos
+        self._pos += count
+        return self._buffer[start:self._pos]
+
+    def _byte(self):
+        if self._pos >= len(self._buffer):
+            self._buffer = bytearray(os.urandom(self._buffer_size))
+            self._pos = 0
+        byte = self._buffer[self._pos]
+        self._pos += 1
+        return byte
+
+    def getrandbits(self, k):
+        """Return an integer with ``k`` random bits."""
+        if k <= 0:
+            raise ValueError('number of bits must be greater than zero')
+        count = (k + 7) // 8
+        value = int(binascii.hexlify(bytes(self._bytes(count))), 16)
+        return value >> (count * 8 - k)
+
+    def random(self):
+        """Return a random float in [0.0, 1.0)."""
+        return self.getrandbits(53) * (2.0 ** -53)
+
+    def randbelow(self, n):
+        """Return a random integer in [0, n) without bias."""
+        if n <= 256:
+            # one byte per attempt, reject the incomplete last round
+            limit = 256 - 256 % n
+            byte = self._byte()
+            while byte >= limit:
+                byte = self._byte()
+            return byte % n
+        k = n.bit_length()
+        value = self.getrandbits(k)
+        while value >= n:
+            value = self.getrandbits(k)
+        return value
+
+    def shuffle(self, x, random=None):
+        """Shuffle list ``x`` in place (Fisher-Yates)."""
+        randbelow = self.randbelow
+        for i in xrange(len(x) - 1, 0, -1):
+            j = randbelow(i + 1)
+            x[i], x[j] = x[j], x[i]
+
+    def _stub(self, *args, **kwargs):
+        return None
+
+    seed = jumpahead = _stub
+
+    def _notimplemented(self, *args, **kwargs):
+        raise NotImplementedError('SecureRandom state is not available')
+
+    getstate = setstate = _notimplemented
+
+def lehmer_encode(record):
+    """Encode an order of cards as a single integer.
+
+    :param record: Card ids in order, as returned by
+       :meth:`pokercards.cards.Deck.record`.
+    :returns: Lehmer code of the order, below ``52!`` for a full deck.
+    """
+    ids = list(bytearray(record))
+    available = sorted(ids)
+    code = 0
+    for card_id in ids:
+        i = available.index(card_id)
+        code = code * len(available) + i
+        del available[i]
+    return code
+
+def lehmer_decode(code, cards):
+    """Decode an order of cards encoded by :func:`lehmer_encode`.
+
+    :param code: The Lehmer code.
+    :param cards: Ids of the cards that were encoded, in any order.
+    :returns: Record of card ids as accepted by
+       :meth:`pokercards.cards.Deck.from_record`.
+    """
+    available = sorted(bytearray(cards))
+    digits = []
+    for base in xrange(1, len(available) + 1):
+        code, digit = divmod(code, base)
+        digits.append(digit)
+    if code:
+        raise ValueError('lehmer_decode(): code out of range')
+    ids = bytearray()
+    for digit in reversed(digits):
+        ids.append(available.pop(digit))
+    return bytes(ids)
@@ -0,0 +1,117 @@
+# Poker Cards
+#
+# Python module for working with poker cards and managing games.
+#
+# Copyright 2013 Michal Belica <devel@beli.sk>
+#
+# This file is part of Poker Cards.
+#
+# Poker Cards is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Poker Cards is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+:mod:`pokercards.variants` -- Game variants
+===========================================
+
+Deck composition and hand ranking rules of poker variants. A variant
+drives the cards of :class:`pokercards.cards.Deck` and provides a
+:class:`pokercards.evaluator.TableEvaluator` generated for its rules::
+
+    deck = Deck(variant=short_deck)
+    hand = short_deck.hand(cards)
+
+The tables of every variant but the standard one are saved to a cache
+directory after they are generated for the first time and loaded from
+there later. The directory is given by the ``POKERCARDS_CACHE``
+environment variable, ``~/.cache/pokercards`` by default.
+"""
+
+import os
+
+from const import __version__, ranks as all_ranks
+from cards import Card, CardSet, PokerHand
+from evaluator import (table_evaluator, TableEvaluator, STANDARD_ORDER,
+        HIGH_CARD, ONE_PAIR, TWO_PAIRS, THREE_OF_A_KIND, STRAIGHT, FLUSH,
+        FULL_HOUSE, FOUR_OF_A_KIND, STRAIGHT_FLUSH)
+
+def cache_dir():
+    """Directory of the evaluator table cache files."""
+    return os.environ.get('POKERCARDS_CACHE') or \
+            os.path.join(os.path.expanduser('~'), '.cache', 'pokercards')
+
+class Variant(object):
+    """Deck composition and hand ranking rules.
+
+    :param name: Name of the variant, also used to name the table
+       cache file.
+    :param ranks: Ranks of the cards in the deck (e.g. ``'AKQJT9876'``),
+       all four suits of each.
+    :param hand_order: Hand ranks from the lowest to the highest,
+       :data:`pokercards.evaluator.STANDARD_ORDER` by default.
+    :param evaluator: Evaluator to use instead of generating one.
+
+    .. attribute:: cards
+
+       List of the cards in the deck, in the order of a new deck.
+
+    .. attribute:: dead
+
+       :class:`pokercards.cards.CardSet` of the cards not in the deck.
+    """
+
+    def __init__(self, name, ranks, hand_order=None, evaluator=None):
+        self.name = name
+        self.ranks = [r for r in all_ranks if r in ranks]
+        if len(self.ranks) < 5:
+            raise ValueError('Variant(): need at least five ranks')
+        self.hand_order = tuple(hand_order) if hand_order else STANDARD_ORDER
+        if sorted(self.hand_order) != sorted(STANDARD_ORDER):
+            raise ValueError('Variant(): hand order must list each hand rank once')
+        self.cards = [card for card in Card._by_id if card.rank in self.ranks]
+        self.dead = CardSet(Card._by_id) - CardSet(self.cards)
+        self._evaluator = evaluator
+
+    @property
+    def evaluator(self):
+        """:class:`pokercards.evaluator.TableEvaluator` for the variant,
+        created on first use. Its tables are loaded from the cache
+        directory, or generated and saved there."""
+        if self._evaluator is None:
+            path = os.path.join(cache_dir(), 'tables-%s-%s.bin'
+                    % (self.name, __version__))
+            self._evaluator = TableEvaluator(ranks=self.ranks,
+                    hand_order=self.hand_order, cache=path)
+        return self._evaluator
+
+    def hand(self, cards):
+        """Evaluate a :class:`pokercards.cards.PokerHand` by the rules
+        of the variant."""
+        hand = PokerHand(cards, evaluate=False)
+        hand.evaluator = self.evaluator
+        hand.evaluate()
+        return hand
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.name)
+
+#: standard 52 card poker, using the shared evaluator
+standard = Variant('standard', all_ranks, evaluator=table_evaluator)
+
+#: short deck (six plus) Hold'em: 36 cards from six up, ``A-6-7-8-9`` is
+#: the lowest straight and a flush beats a full house
+short_deck = Variant('short_deck', 'AKQJT9876', hand_order=(HIGH_CARD,
+    ONE_PAIR, TWO_PAIRS, THREE_OF_A_KIND, STRAIGHT, FULL_HOUSE, FLUSH,
+    FOUR_OF_A_KIND, STRAIGHT_FLUSH))
+
+#: variants by name
+variants = dict((v.name, v) for v in (standard, short_deck))
@@ -21,12 +21,23 @@
 # You should have received a copy of the GNU General Public License
 # along with Poker Cards.  If not, see <http://www.gnu.org/licenses/>.
 
+import math
+import os
+import sys
+import json
+import operator
 import random
+import shutil
+import logging
+import tempfile
+import subprocess
 import unittest
+import itertools
 from collections import Counter
 
-from pokercards import cards
-from pokercards.logsetup import setup_console_logging, INFO
+from pokercards import cards, evaluator, equity, batch, secure, bench, game, ranges, \
+        isomorphism, database, history, lowball, variants
+from pokercards.logsetup import setup_console_logging, enable_trace, INFO
 
 class TestCard(unittest.TestCase):
     def setUp(self):
@@ -53,6 +64,39 @@ descending rank."""
         self.assertRaises(ValueError, cards.Card, 'xH')
         self.assertRaises(ValueError, cards.Card, 'Kx')
 
+    def test_interned(self):
+        """Test cards are shared immutable instances"""
+        card = cards.Card('AS')
+        self.assertTrue(card is cards.Card('A', 'S'))
+        self.assertTrue(card is cards.Card.from_id(card.id))
+        self.assertRaises(AttributeError, setattr, card, 'rank', 'K')
+        self.assertEqual(card.rank_value, 12)
+        self.assertEqual(cards.Card('2C').rank_value, 0)
+        self.assertEqual(len(set(c.id for c in cards.Deck().active)), 52)
+
+class TestCardSet(unittest.TestCase):
+    def setUp(self):
+        self.a = cards.CardSet(cards.Card.card_list('AS', 'KH', '2C'))
+        self.b = cards.CardSet(cards.Card.card_list('KH', 'QD'))
+
+    def test_operations(self):
+        """Test set operations on card sets"""
+        self.assertEqual(len(self.a), 3)
+        self.assertTrue(cards.Card('AS') in self.a)
+        self.assertFalse(cards.Card('QD') in self.a)
+        self.assertEqual(set(self.a | self.b),
+                set(cards.Card.card_list('AS', 'KH', '2C', 'QD')))
+        self.assertEqual((self.a & self.b).to_list(), [cards.Card('KH')])
+        self.assertEqual(set(self.a - self.b), set(cards.Card.card_list('AS', '2C')))
+        self.assertEqual(cards.CardSet(self.a.to_list()), self.a)
+        self.assertFalse(cards.CardSet())
+
+    def test_evaluate(self):
+        """Test evaluating a card set directly"""
+        hand = cards.Card.card_list('KC', 'QH', 'JH', 'TH', '9H', '8H', '7H')
+        self.assertEqual(cards.PokerHand(cards.CardSet(hand)).strength,
+                cards.PokerHand(hand).strength)
+
 class TestDeck(unittest.TestCase):
     def setUp(self):
         """Create a new deck for testing."""
@@ -103,6 +147,83 @@ class TestDeck(unittest.TestCase):
         # see if the cards really are on top of the deck
         self.assertEqual(self.deck.active[-3:], stack)
 
+    def test_dead(self):
+        """Test leaving dead cards out of the deck"""
+        dead = cards.CardSet(cards.Card.card_list('AS', 'AH'))
+        deck = cards.Deck(dead=dead)
+        self.assertEqual(len(deck.active), 50)
+        self.assertFalse(cards.Card('AS') in deck)
+        card = deck.pop()
+        self.assertFalse(card in deck)
+        self.assertEqual(deck.removed, cards.CardSet([card]))
+        self.assertRaises(Exception, deck.return_cards, [cards.Card('AS')])
+        deck.return_cards(deck.removed)
+        self.assertTrue(card in deck)
+        self.assertEqual(deck.active[0], card)
+
+    def test_return_all(self):
+        """Test returning all cards on top of a seeded deck"""
+        deck = cards.Deck(rng=random.Random(3))
+        deck.shuffle()
+        top = deck.active[-4:]
+        deck.pop()
+        deck.discard()
+        deck.pop()
+        deck.discard()
+        deck.return_all(pos=cards.POS_TOP)
+        self.assertEqual(deck.stats(), (52, 0, 0))
+        self.assertEqual(set(deck.active[-4:]), set(top))
+        other = cards.Deck(rng=random.Random(3))
+        other.shuffle()
+        self.assertEqual(other.active[-4:], top)
+
+class TestFastDeck(unittest.TestCase):
+    def test_deal(self):
+        """Test dealing all cards from a fast deck"""
+        deck = cards.FastDeck(dead=cards.Card.card_list('AS'), seed=1)
+        dealt = deck.deal(10) + [deck.pop() for i in xrange(41)]
+        self.assertEqual(len(set(dealt)), 51)
+        self.assertFalse(cards.Card('AS') in dealt)
+        self.assertEqual(len(deck), 0)
+        self.assertRaises(IndexError, deck.pop)
+        deck.reset()
+        self.assertEqual(len(deck), 51)
+
+    def test_seed(self):
+        """Test seeded fast decks deal the same cards"""
+        deck1 = cards.FastDeck(seed=5)
+        deck2 = cards.FastDeck(rng=random.Random(5))
+        self.assertEqual(deck1.deal(7), deck2.deal(7))
+        deck1.reset()
+        self.assertEqual(deck1.dealt, [])
+
+class TestSecure(unittest.TestCase):
+    def test_replay(self):
+        """Test replaying a secure shuffle from its record"""
+        deck = cards.Deck(rng=secure.SecureRandom(buffer_size=64))
+        record = deck.shuffle()
+        self.assertEqual(len(record), 52)
+        self.assertEqual(cards.Deck.from_record(record).active, deck.active)
+        code = secure.lehmer_encode(record)
+        self.assertTrue(code < math.factorial(52))
+        self.assertEqual(secure.lehmer_decode(code, record), record)
+
+    def test_partial_record(self):
+        """Test replaying a deck with dead cards"""
+        deck = cards.Deck(dead=cards.Card.card_list('AS', 'KD'))
+        deck.shuffle()
+        replay = cards.Deck.from_record(deck.record())
+        self.assertEqual(replay.active, deck.active)
+        self.assertFalse(cards.Card('KD') in replay)
+
+    def test_randbelow(self):
+        """Test bounded random integers stay in range"""
+        rng = secure.SecureRandom()
+        values = set(rng.randbelow(5) for i in xrange(500))
+        self.assertEqual(values, set(range(5)))
+        self.assertTrue(0 <= rng.randbelow(10 ** 30) < 10 ** 30)
+        self.assertRaises(NotImplementedError, rng.getstate)
+
 class TestHand(unittest.TestCase):
     def setUp(self):
         """Create some hands for testing, along with information on how
@@ -176,10 +297,783 @@ and compare results to those entered manually"""
         hands.sort(reverse=True)
         self.assertEqual(hands2, hands)
 
+    def test_strength_key(self):
+        """Test hands compare, hash and group by strength"""
+        hands = [x['hand'] for x in self.testhands]
+        self.assertEqual(sorted(hands, key=operator.attrgetter('strength'), reverse=True),
+                hands)
+        self.assertEqual(max(hands), hands[0])
+        tie = cards.PokerHand(cards.Card.card_list('5S', 'AD', '5D', 'KH', '2S', 'KC', '7D'))
+        self.assertEqual(tie, hands[4])
+        self.assertNotEqual(tie, hands[5])
+        self.assertEqual(len(set([tie, hands[4], hands[5]])), 2)
+
+class TestOmaha(unittest.TestCase):
+    def test_brute_force(self):
+        """Test Omaha evaluation against all two plus three card hands"""
+        ev = evaluator.table_evaluator
+        rng = random.Random(2)
+        deck = list(cards.Card._by_id)
+        for hole_size, board_size in ((4, 3), (4, 5), (5, 4), (5, 5)):
+            for i in xrange(300):
+                dealt = rng.sample(deck, hole_size + board_size)
+                hole, board = dealt[:hole_size], dealt[hole_size:]
+                expected = max(ev.evaluate(list(h) + list(b))
+                        for h in itertools.combinations(hole, 2)
+                        for b in itertools.combinations(board, 3))
+                self.assertEqual(ev.evaluate_omaha(hole, board), expected)
+
+    def test_rules(self):
+        """Test the two plus three rule"""
+        ev = evaluator.table_evaluator
+        board = cards.Card.card_list('AS', 'KS', 'QS', 'JS', '2D')
+        # one spade in hand does not make a flush
+        hole = cards.Card.card_list('TS', 'JH', '4C', '7D')
+        self.assertEqual(ev.evaluate_omaha(hole, board) >> evaluator.RANK_SHIFT,
+                evaluator.STRAIGHT)
+        strengths = ev.evaluate_omaha_masks([cards.CardSet(hole).mask,
+            cards.CardSet(cards.Card.card_list('TS', '9S', '4C', '7D')).mask],
+            cards.CardSet(board).mask)
+        self.assertEqual(strengths[1] >> evaluator.RANK_SHIFT, evaluator.STRAIGHT_FLUSH)
+        self.assertRaises(ValueError, ev.evaluate_omaha, hole, board[:2])
+
+class TestLowball(unittest.TestCase):
+    def test_ace_five(self):
+        """Test ace-to-five low ordering, qualifier and best five of seven"""
+        low = lowball.ace_five_evaluator.evaluate
+        C = cards.Card.card_list
+        wheel = low(C('AS', '2H', '3D', '4C', '5S'))
+        self.assertTrue(wheel > low(C('6S', '2H', '3D', '4C', 'AS')))
+        self.assertTrue(low(C('KS', 'QH', 'JD', '9C', '7S')) > low(C('AS', 'AH', '2D', '3C', '4S')))
+        self.assertEqual(low(C('AS', '2S', '3S', '4S', '5S')), wheel)
+        self.assertEqual(low(C('9S', '2H', '3D', '4C', '5S'), '8'), 0)
+        self.assertTrue(low(C('8S', '7H', '6D', '4C', '5S'), '8') > 0)
+        self.assertRaises(ValueError, low,
+                C('AS', '2H', '3D', '4C', '5S', '6S', '7S', '8S'))
+        rng = random.Random(4)
+        deck = list(cards.Card._by_id)
+        for i in xrange(300):
+            hand = rng.sample(deck, 7)
+            self.assertEqual(low(hand),
+                    max(low(list(five)) for five in itertools.combinations(hand, 5)))
+
+    def test_deuce_seven(self):
+        """Test deuce-to-seven low ordering"""
+        low = lowball.deuce_seven_evaluator.evaluate
+        C = cards.Card.card_list
+        best = low(C('7S', '5H', '4D', '3C', '2S'))
+        self.assertTrue(best > low(C('7S', '6H', '4D', '3C', '2S')))
+        # the ace is high and A-5 is no straight
+        self.assertTrue(low(C('AS', '5H', '4D', '3C', '2S')) < low(C('KS', '5H', '4D', '3C', '2S')))
+        self.assertTrue(low(C('AS', '5H', '4D', '3C', '2S')) > low(C('2D', '2H', '4D', '3C', '5S')))
+        self.assertTrue(low(C('6S', '5H', '4D', '3C', '2S')) < low(C('KS', 'QH', 'JD', '9C', '8S')))
+        self.assertTrue(low(C('7S', '5S', '4S', '3S', '2S')) < low(C('8S', '6H', '4D', '3C', '2S')))
+        self.assertEqual(low(C('7S', '5H', '4D', '3C', '2S', 'KD')), best)
+
+    def test_omaha_hilo(self):
+        """Test Omaha low against all two plus three card hands and the
+        split of a hi-lo pot"""
+        ace_five = lowball.ace_five_evaluator
+        rng = random.Random(5)
+        deck = list(cards.Card._by_id)
+        for i in xrange(300):
+            dealt = rng.sample(deck, 9)
+            hole, board = dealt[:4], dealt[4:]
+            expected = max(ace_five.evaluate(list(h) + list(b), '8')
+                    for h in itertools.combinations(hole, 2)
+                    for b in itertools.combinations(board, 3))
+            self.assertEqual(ace_five.evaluate_omaha_masks(
+                [cards.CardSet(hole).mask], cards.CardSet(board).mask), [expected])
+        self.assertEqual(game.resolve_hilo_showdown([5, 3, None], [0, 9, 7], [10, 10, 10]),
+                [15, 15, 0])
+        self.assertEqual(game.resolve_hilo_showdown([5, 3, None], [0, 0, 7], [10, 11, 10]),
+                [30, 1, 0])
+        self.assertEqual(game.resolve_hilo_showdown([5, 5, 1], [2, 2, 3], [10, 10, 11]),
+                [7, 8, 16])
+
+class TestVariants(unittest.TestCase):
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        self.saved = os.environ.get('POKERCARDS_CACHE')
+        os.environ['POKERCARDS_CACHE'] = self.cache
+
+    def tearDown(self):
+        if self.saved is None:
+            del os.environ['POKERCARDS_CACHE']
+        else:
+            os.environ['POKERCARDS_CACHE'] = self.saved
+        shutil.rmtree(self.cache)
+
+    def test_short_deck(self):
+        """Test short deck composition and hand ranking"""
+        short = variants.short_deck
+        self.assertEqual(len(cards.Deck(variant=short).active), 36)
+        self.assertEqual(len(cards.FastDeck(variant=short)), 36)
+        self.assertFalse(cards.Card('5S') in cards.Deck(variant=short))
+        C = cards.Card.card_list
+        straight = short.hand(C('AS', '6H', '7D', '8C', '9S', 'KD', 'KH'))
+        self.assertEqual(straight.hand_rank, evaluator.STRAIGHT)
+        self.assertEqual(straight.hand_cards, C('9S', '8C', '7D', '6H', 'AS'))
+        flush = short.hand(C('AS', 'JS', '7S', '8S', '9S'))
+        full_house = short.hand(C('AS', 'AH', 'AD', 'KC', 'KS'))
+        self.assertEqual((flush.hand_rank, full_house.hand_rank),
+                (evaluator.FLUSH, evaluator.FULL_HOUSE))
+        self.assertTrue(flush > full_house)
+        self.assertTrue(variants.standard.hand(C('AS', 'JS', '7S', '8S', '9S'))
+                < variants.standard.hand(C('AS', 'AH', 'AD', 'KC', 'KS')))
+
+    def test_cache(self):
+        """Test generated tables are saved and loaded"""
+        first = variants.Variant('test', 'AKQJT9876', variants.short_deck.hand_order)
+        first.evaluator.build()
+        self.assertEqual(len(os.listdir(self.cache)), 1)
+        second = variants.Variant('test', 'AKQJT9876', variants.short_deck.hand_order)
+        second.evaluator.build()
+        self.assertEqual(second.evaluator._nonflush, first.evaluator._nonflush)
+        self.assertEqual(second.evaluator._flush, first.evaluator._flush)
+        # tables of different rules are not loaded
+        other = variants.Variant('test', 'AKQJT9876')
+        other.evaluator.build()
+        self.assertNotEqual(other.evaluator._flush, first.evaluator._flush)
+        self.assertTrue(variants.standard.evaluator is evaluator.table_evaluator)
+
+class TestIncremental(unittest.TestCase):
+    def test_streets(self):
+        """Test incremental evaluation street by street"""
+        deck = cards.FastDeck(seed=11)
+        for i in xrange(200):
+            deck.reset()
+            dealt = deck.deal(7)
+            hand = evaluator.IncrementalEvaluator(dealt[:4])
+            for n in (5, 6, 7):
+                hand.add(dealt[n - 1])
+                self.assertEqual(hand.strength, cards.PokerHand(dealt[:n]).strength)
+            hand.remove(dealt[0])
+            self.assertEqual(hand.strength, cards.PokerHand(dealt[1:]).strength)
+
+    def test_errors(self):
+        """Test adding a held card or removing a missing one"""
+        hand = evaluator.IncrementalEvaluator(cards.Card.card_list('AS', 'AH'))
+        self.assertEqual(hand.hand_rank, 1)
+        self.assertRaises(ValueError, hand.add, cards.Card('AS'))
+        self.assertRaises(ValueError, hand.remove, cards.Card('KS'))
+
+class TestRecords(unittest.TestCase):
+    def test_record(self):
+        """Test hand records match poker hands and leave input alone"""
+        rng = random.Random(6)
+        deck = list(cards.Card._by_id)
+        for i in xrange(200):
+            dealt = rng.sample(deck, 7)
+            original = dealt[:]
+            hand = cards.PokerHand(dealt)
+            record = cards.evaluate_hand(dealt)
+            self.assertEqual(dealt, original)
+            self.assertEqual(record, hand)
+            self.assertEqual(hash(record), hash(hand))
+            self.assertEqual(record.hand_rank, hand.hand_rank)
+            # ties between equal ranks may come out in a different order
+            self.assertEqual(set(record.cards), set(hand.cards))
+            self.assertEqual([c.rank for c in record.hand_cards],
+                    [c.rank for c in hand.hand_cards])
+            self.assertEqual([c.rank for c in record.kickers],
+                    [c.rank for c in hand.kickers])
+            self.assertEqual(hand.to_record().mask, record.mask)
+        self.assertRaises(AttributeError, setattr, record, 'strength', 0)
+
+    def test_array(self):
+        """Test record array round trip"""
+        rng = random.Random(7)
+        deck = list(cards.Card._by_id)
+        hands = [rng.sample(deck, 7) for i in xrange(100)]
+        records = cards.HandRecordArray(hands)
+        self.assertEqual(len(records), 100)
+        self.assertEqual(list(records), [cards.evaluate_hand(h) for h in hands])
+        self.assertEqual([r.mask for r in records], [cards.CardSet(h).mask for h in hands])
+        self.assertEqual(set(records[-1].cards), set(hands[-1]))
+        self.assertEqual(list(records.strengths), [r.strength for r in records])
+
+class TestCache(unittest.TestCase):
+    def tearDown(self):
+        cards.disable_cache()
+
+    def test_cache(self):
+        """Test cached evaluation, hit counting and eviction"""
+        cache = cards.enable_cache(maxsize=2)
+        self.assertTrue(cards.PokerHand.evaluator is cache)
+        hand = cards.Card.card_list('5C', 'AS', '5H', 'KS', '2D', 'KD', '7H')
+        strength = cards.PokerHand(hand[:]).strength
+        self.assertEqual(cards.PokerHand(list(reversed(hand))).strength, strength)
+        self.assertEqual(cards.PokerHand(cards.CardSet(hand)).strength, strength)
+        cards.PokerHand(cards.Card.card_list('AS', 'KS', 'QS', 'JS', 'TS'))
+        cards.PokerHand(cards.Card.card_list('2S', '3S', '4S', '5S', '7D'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 3))
+        self.assertEqual((stats['size'], stats['evictions']), (2, 1))
+        cards.disable_cache()
+        self.assertTrue(cards.PokerHand.evaluator is cache.backend)
+
+    def test_backend(self):
+        """Test the cache forwards to its backend and refuses the classic one"""
+        cache = cards.enable_cache()
+        evaluator.warm_up(cards.PokerHand.evaluator)
+        mask = cards.CardSet(cards.Card.card_list('AS', 'KS', 'QS', 'JS', 'TS')).mask
+        self.assertEqual(cache.evaluate_mask(mask),
+                evaluator.table_evaluator.evaluate_mask(mask))
+        cards.disable_cache()
+        saved = cards.PokerHand.evaluator
+        cards.PokerHand.evaluator = None
+        try:
+            self.assertRaises(ValueError, cards.enable_cache)
+        finally:
+            cards.PokerHand.evaluator = saved
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        class Collect(logging.Handler):
+            def emit(handler, record):
+                self.records.append(record)
+        self.records = []
+        self.handler = Collect()
+        cards.trace_logger.addHandler(self.handler)
+
+    def tearDown(self):
+        cards.trace_logger.removeHandler(self.handler)
+        enable_trace(enabled=False)
+
+    def test_trace(self):
+        """Test trace events are emitted only when enabled"""
+        hand = cards.Card.card_list('5C', 'AS', '5H', 'KS', '2D', 'KD', '7H')
+        cards.PokerHand(hand[:])
+        self.assertEqual(self.records, [])
+        self.assertTrue(enable_trace())
+        cards.PokerHand(hand[:])
+        self.assertEqual(len(self.records), 1)
+        trace = self.records[0].trace
+        self.assertEqual(trace['hand_rank'], 2)
+        self.assertEqual(sorted(trace['hand_cards']), ['5C', '5H', 'KD', 'KS'])
+        self.assertEqual(trace['kickers'], ['AS'])
+
+class TestTableEvaluator(unittest.TestCase):
+    def setUp(self):
+        class ClassicHand(cards.PokerHand):
+            evaluator = None
+        self.ClassicHand = ClassicHand
+
+    def test_classic_agrees(self):
+        """Test the table evaluator against the classic evaluation"""
+        test = TestHand('test_evaluation')
+        test.setUp()
+        for testhand in test.testhands:
+            table = testhand['hand']
+            classic = self.ClassicHand(table.cards[:])
+            self.assertEqual(table.strength, classic.strength)
+            self.assertEqual(Counter(table.hand_cards), Counter(classic.hand_cards))
+            self.assertEqual(Counter(table.kickers), Counter(classic.kickers))
+
+    def test_wheel(self):
+        """Test the ace plays low in a five-high straight"""
+        wheel = cards.PokerHand(cards.Card.card_list('AS', '2H', '3D', '4C', '5S', 'KD'))
+        six = cards.PokerHand(cards.Card.card_list('2H', '3D', '4C', '5S', '6H'))
+        self.assertEqual(wheel.hand_rank, 4)
+        self.assertEqual([c.rank for c in wheel.hand_cards], list('5432A'))
+        self.assertTrue(six.strength > wheel.strength)
+
+    def test_straight_flush_with_pair(self):
+        """Test straight flush hidden behind a paired card"""
+        hand = cards.PokerHand(
+                cards.Card.card_list('QH', 'JH', 'JS', 'TH', '9H', '8H', '8D'))
+        self.assertEqual(hand.hand_rank, 8)
+        self.assertEqual(hand.hand_cards,
+                cards.Card.card_list('QH', 'JH', 'TH', '9H', '8H'))
+
+    def test_table_file(self):
+        """Test precompiled tables are loaded and bad files rebuilt"""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'tables.bin')
+            self.assertEqual(evaluator.main([path]), 0)
+            loaded = evaluator.TableEvaluator(cache=path)
+            evaluator.warm_up(loaded)
+            reference = evaluator.table_evaluator
+            evaluator.warm_up()
+            self.assertEqual(loaded._nonflush, reference._nonflush)
+            self.assertEqual(loaded._flush, reference._flush)
+            self.assertEqual(loaded._straights, reference._straights)
+            self.assertEqual(loaded._mask_quinary, reference._mask_quinary)
+            # truncated file is ignored and replaced
+            with open(path, 'r+b') as f:
+                f.truncate(100)
+            rebuilt = evaluator.TableEvaluator(cache=path)
+            rebuilt.build()
+            self.assertEqual(rebuilt._flush, reference._flush)
+            self.assertTrue(os.path.getsize(path) > 100)
+            # tables of other rules are not loaded
+            other = evaluator.TableEvaluator(ace_low=False, cache=path)
+            other.build()
+            self.assertNotEqual(other._straights, reference._straights)
+        finally:
+            shutil.rmtree(directory)
+
+class TestEquity(unittest.TestCase):
+    def test_pocket_aces(self):
+        """Test pocket aces against one random hand"""
+        result = equity.equity(cards.Card.card_list('AS', 'AH'),
+                iterations=4000, seed=1)
+        self.assertEqual(result.trials, 4000)
+        self.assertTrue(0.82 < result.equity < 0.88)
+        low, high = result.interval
+        self.assertTrue(low < result.equity < high)
+        self.assertEqual(result.wins + result.ties + result.losses, 4000)
+
+    def test_seed(self):
+        """Test results are reproducible with a seed"""
+        hole = cards.Card.card_list('7S', '2H')
+        board = cards.Card.card_list('7D', 'KC', '2S')
+        r1 = equity.equity(hole, board, opponents=2, iterations=3000, seed=7)
+        r2 = equity.equity(hole, board, opponents=2, iterations=3000, seed=7)
+        self.assertEqual((r1.wins, r1.ties, r1.losses), (r2.wins, r2.ties, r2.losses))
+
+    def test_nuts(self):
+        """Test a made royal flush always wins"""
+        result = equity.equity(cards.Card.card_list('AS', 'KS'),
+                cards.Card.card_list('QS', 'JS', 'TS', '2H'), opponents=3,
+                iterations=500)
+        self.assertEqual(result.equity, 1.0)
+
+    def test_unbounded(self):
+        """Test stopping by time or precision alone"""
+        aces = cards.Card.card_list('AS', 'AH')
+        result = equity.equity(aces, iterations=None, time_limit=0.2, seed=1)
+        self.assertTrue(result.trials > 0)
+        self.assertTrue(0.75 < result.equity < 0.95, result)
+        result = equity.equity(aces, iterations=None, precision=0.02, seed=1)
+        low, high = result.interval
+        self.assertTrue(result.trials > 0 and (high - low) / 2 <= 0.02)
+        self.assertRaises(ValueError, equity.equity, aces, iterations=None)
+
+    def test_invalid(self):
+        """Test overlapping cards are rejected"""
+        self.assertRaises(ValueError, equity.equity,
+                cards.Card.card_list('AS', 'KS'), cards.Card.card_list('AS', 'QS', 'JS'))
+
+class TestExactEquity(unittest.TestCase):
+    def test_turn(self):
+        """Test exact equity with one card to come"""
+        kings, aces = equity.exact_equity(
+                [cards.Card.card_list('KS', 'KH'), cards.Card.card_list('AS', 'AH')],
+                cards.Card.card_list('2C', '7D', '9C', 'TD'))
+        self.assertEqual(kings.trials, 44)
+        self.assertEqual(kings.wins, 2)
+        self.assertEqual(aces.wins, 42)
+        self.assertEqual(aces.interval, (aces.equity, aces.equity))
+
+    def test_river(self):
+        """Test a complete board is counted once with worker processes"""
+        hands = [cards.Card.card_list('KS', 'KH'), cards.Card.card_list('AS', 'AH')]
+        board = cards.Card.card_list('2C', '7D', '9C', 'TD', 'KC')
+        for processes in (1, 2):
+            kings, aces = equity.exact_equity(hands, board, processes=processes)
+            self.assertEqual((kings.trials, kings.wins, aces.losses), (1, 1, 1))
+        # tasks of range_equity without the first stub card have no runout
+        self.assertEqual(list(equity._range_runouts([], 0, [0], None, None)), [0])
+        self.assertEqual(list(equity._range_runouts([], 0, [], None, None)), [])
+        hero, villain = ranges.Range('KsKh'), ranges.Range('AsAh, QQ')
+        matrix = equity.range_equity(hero, villain, board, processes=2)
+        self.assertEqual([list(row) for row in matrix], [[1.0] * 7])
+
+    def test_isomorphism(self):
+        """Test suit isomorphism against plain enumeration of the runouts"""
+        hands = [cards.Card.card_list('AS', 'AH'), cards.Card.card_list('KS', 'QH')]
+        board = cards.Card.card_list('2S', '7H', 'JS')
+        deck = cards.Deck(dead=cards.CardSet(hands[0] + hands[1] + board))
+        wins = [0, 0]
+        for runout in itertools.combinations(deck.active, 2):
+            h1, h2 = [cards.PokerHand(hand + board + list(runout)) for hand in hands]
+            if h1.strength > h2.strength:
+                wins[0] += 1
+            elif h2.strength > h1.strength:
+                wins[1] += 1
+        results = equity.exact_equity(hands, board)
+        self.assertEqual([r.wins for r in results], wins)
+        self.assertEqual(results[0].trials, 990)
+
+class TestIsomorphism(unittest.TestCase):
+    def test_canonicalize(self):
+        """Test suit relabellings map to the same canonical form"""
+        board = cards.Card.card_list('2C', '7D', '9S')
+        first = isomorphism.canonicalize(cards.Card.card_list('AH', 'KH'), board)
+        second = isomorphism.canonicalize(cards.Card.card_list('AS', 'KS'),
+                cards.Card.card_list('2D', '7C', '9H'))
+        self.assertEqual(first[0], second[0])
+        groups, perm = first
+        self.assertEqual(sorted(isomorphism.permute_cards(board, perm)),
+                sorted(groups[1]))
+        other = isomorphism.canonicalize(cards.Card.card_list('AH', 'KH'),
+                cards.Card.card_list('2H', '7D', '9S'))
+        self.assertNotEqual(first[0], other[0])
+
+    def test_boards(self):
+        """Test enumeration of flops up to isomorphism"""
+        flops = isomorphism.canonical_boards(3)
+        self.assertEqual(len(flops), 1755)
+        self.assertEqual(sum(count for board, count in flops), 22100)
+        for board, count in flops[:50]:
+            self.assertEqual(isomorphism.orbit_size([board]), count)
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_preflop(self):
+        """Test building and reading a preflop database"""
+        self.assertEqual(database.build_database(self.path, iterations=200,
+                classes=['AA', '72o', 'AKs'], seed=1), 3)
+        with database.EquityDatabase(self.path) as db:
+            self.assertEqual(len(db), 169)
+            aces = db.equity(cards.Card.card_list('AS', 'AH'))
+            self.assertEqual(aces, db.equity(cards.Card.card_list('AD', 'AC')))
+            self.assertTrue(0.75 < aces < 0.9, aces)
+            self.assertTrue(db.equity(cards.Card.card_list('2C', '7H')) < 0.45)
+            self.assertRaises(KeyError, db.equity, cards.Card.card_list('KS', 'KH'))
+            self.assertRaises(ValueError, db.equity, cards.Card.card_list('KS'))
+
+    def test_flop(self):
+        """Test flop lookups of isomorphic situations share a slot"""
+        database.build_database(self.path, board_size=3, iterations=10,
+                classes=['AKs'], seed=1)
+        with database.EquityDatabase(self.path) as db:
+            first = db.equity(cards.Card.card_list('AH', 'KH'),
+                    cards.Card.card_list('QH', 'JH', '2C'))
+            second = db.equity(cards.Card.card_list('KD', 'AD'),
+                    cards.Card.card_list('2S', 'JD', 'QD'))
+            self.assertEqual(first, second)
+            self.assertRaises(ValueError, db.equity, cards.Card.card_list('AH', 'KH'))
+
+    def test_invalid(self):
+        """Test reading a file which is not a database"""
+        with open(self.path, 'wb') as f:
+            f.write(b'not a database at all')
+        self.assertRaises(ValueError, database.EquityDatabase, self.path)
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        deck = [card.rank + card.suit.lower() for card in cards.Card._by_id]
+        self.lines = ['# hand board holes\n', '\n']
+        for i in xrange(300):
+            dealt = rng.sample(deck, 9)
+            self.lines.append('%d %s %s %s\n' % (i, ''.join(dealt[:5]),
+                ''.join(dealt[5:7]), ''.join(dealt[7:])))
+
+    def test_stream(self):
+        """Test streamed results against poker hands"""
+        results = list(history.evaluate_stream(iter(self.lines), batch_size=64))
+        self.assertEqual(len(results), 300)
+        for line, result in zip(self.lines[2:], results):
+            fields = line.split()
+            self.assertEqual(result.hand_id, fields[0])
+            hands = [cards.PokerHand(list(cards.CardSet.from_mask(
+                history.parse_cards(fields[1] + hole)))) for hole in fields[2:]]
+            self.assertEqual(result.strengths, [h.strength for h in hands])
+            best = max(hands)
+            self.assertEqual(result.winners,
+                    [i for i, h in enumerate(hands) if h == best])
+
+    def test_processes(self):
+        """Test ordered output of worker processes reading a mapped file"""
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.writelines(self.lines)
+            serial = list(history.evaluate_stream(history.read_lines(path)))
+            parallel = list(history.evaluate_stream(
+                history.read_lines(path, use_mmap=True), batch_size=16,
+                processes=2))
+        finally:
+            os.remove(path)
+        self.assertEqual(serial, parallel)
+
+    def test_errors(self):
+        """Test invalid lines"""
+        self.assertRaises(ValueError, history.parse_cards, 'AsXx')
+        self.assertRaises(ValueError, history.parse_cards, 'AsAs')
+        self.assertRaises(ValueError, list,
+                history.evaluate_stream(['1 AsKsQsJsTs 9s8s AsKd\n']))
+
+class TestRanges(unittest.TestCase):
+    def test_parse(self):
+        """Test combination counts of range notation"""
+        for text, count in (('QQ+', 18), ('AKs', 4), ('A5s-A2s', 16),
+                ('KQo', 12), ('AK', 16), ('99-66', 24), ('ATs+', 16),
+                ('QQ+, AKs, A5s-A2s, KQo', 50), ('AsKs', 1), ('22+', 78)):
+            self.assertEqual(len(ranges.Range(text)), count, text)
+        self.assertEqual(len(ranges.combos), 1326)
+        self.assertEqual(len(ranges.hand_classes()), 169)
+        self.assertRaises(ValueError, ranges.Range, 'AX')
+        self.assertRaises(ValueError, ranges.Range, 'AsAs')
+
+    def test_weights(self):
+        """Test weights, removal and dead cards"""
+        r = ranges.Range('AK, AKo:0.5, AsKs:0')
+        self.assertEqual(len(r), 15)
+        self.assertFalse(cards.Card.card_list('AS', 'KS') in r)
+        self.assertTrue(cards.Card.card_list('KH', 'AH') in r)
+        masks, weights = r.masks()
+        self.assertEqual(sorted(weights), [0.5] * 12 + [1.0] * 3)
+        self.assertEqual(len(r.remove_dead(cards.Card.card_list('AH'))), 11)
+        for a, b, weight in r:
+            self.assertEqual(weight, 1.0 if a.suit == b.suit else 0.5)
+
+    def test_equity(self):
+        """Test equity against a range"""
+        aces = cards.Card.card_list('AS', 'AH')
+        result = equity.equity(aces, ranges=[ranges.Range('KK')],
+                iterations=4000, seed=1)
+        self.assertTrue(0.78 < result.equity < 0.86, result)
+        self.assertRaises(ValueError, equity.equity, aces,
+                ranges=[ranges.Range('AsAh')])
+
+    def test_pick_frequencies(self):
+        """Test range combinations are picked in proportion to valid deals"""
+        tables = [equity._range_table(ranges.Range(text), 0)
+                for text in ('KsKh, QcQd', 'KsJs, KhJh, 2c2d')]
+        kings = cards.CardSet(cards.Card.card_list('KS', 'KH')).mask
+        rng = random.Random(1)
+        picks = [equity._pick_ranges(rng, tables, 0) for i in xrange(8000)]
+        for picked in picks:
+            self.assertFalse(picked[0] & picked[1])
+        share = sum(picked[0] == kings for picked in picks) / 8000.0
+        # one of the four valid deals gives KsKh
+        self.assertTrue(0.22 < share < 0.28, share)
+
+    def test_conflicting_ranges(self):
+        """Test ranges which can not all be dealt are rejected"""
+        kings = cards.Card.card_list('KS', 'KH')
+        self.assertRaises(ValueError, equity.equity, kings,
+                ranges=[ranges.Range('AsAh'), ranges.Range('AsAh')], iterations=10)
+        board = cards.Card.card_list('AS', '2C', '7D')
+        self.assertRaises(ValueError, equity.equity, kings, board,
+                ranges=[ranges.Range('AA')] * 2, iterations=10)
+        result = equity.equity(kings, board, ranges=[ranges.Range('AA'), ranges.Range('QQ')],
+                iterations=10, seed=1)
+        self.assertEqual(result.trials, 10)
+
+    def test_range_equity(self):
+        """Test range against range equity matrix"""
+        board = cards.Card.card_list('2C', '7D', '9C')
+        hero, villain = ranges.Range('AsAh, AcAd'), ranges.Range('KK, AsKs')
+        matrix = equity.range_equity(hero, villain, board)
+        self.assertEqual((len(matrix), len(matrix[0])), (2, 7))
+        for i, a in enumerate(hero.masks()[0]):
+            for j, b in enumerate(villain.masks()[0]):
+                if a & b or (a | b) & cards.CardSet(board).mask:
+                    self.assertTrue(math.isnan(matrix[i][j]))
+                    continue
+                hands = [list(cards.CardSet.from_mask(m)) for m in (a, b)]
+                exact = equity.exact_equity(hands, board)[0].equity
+                self.assertAlmostEqual(matrix[i][j], exact)
+        sampled = equity.range_equity(hero, villain, board, iterations=2000, seed=1)
+        self.assertTrue(math.isnan(sampled[0][0]))
+        self.assertTrue(abs(sampled[1][1] - matrix[1][1]) < 0.05)
+
+@unittest.skipIf(batch.numpy is None, 'NumPy not available')
+class TestBatch(unittest.TestCase):
+    def test_matches_hand(self):
+        """Test batch evaluation gives the same strengths as PokerHand"""
+        deck = cards.Deck().active
+        for size in (5, 6, 7):
+            rows = [random.sample(deck, size) for i in xrange(500)]
+            ids = batch.numpy.array([[c.id for c in row] for row in rows],
+                    dtype=batch.numpy.uint8)
+            strength, hand_rank = batch.evaluate_batch(ids)
+            hands = [cards.PokerHand(row) for row in rows]
+            self.assertEqual(list(strength), [h.strength for h in hands])
+            self.assertEqual(list(hand_rank), [h.hand_rank for h in hands])
+
+    def test_variant(self):
+        """Test batch hand ranks follow the hand order of a variant"""
+        rules = variants.short_deck
+        # own evaluator, no table cache written
+        short = variants.Variant('short', rules.ranks, rules.hand_order,
+                evaluator.TableEvaluator(rules.ranks, rules.hand_order))
+        rows = [random.sample(short.cards, 7) for i in xrange(500)]
+        rows.append(cards.Card.card_list('AS', 'JS', '7S', '8S', '9S', 'KD', 'KH'))
+        ids = batch.numpy.array([[c.id for c in row] for row in rows],
+                dtype=batch.numpy.uint8)
+        strength, hand_rank = batch.evaluate_batch(ids, short.evaluator)
+        hands = [short.hand(row) for row in rows]
+        self.assertEqual(list(strength), [h.strength for h in hands])
+        self.assertEqual(list(hand_rank), [h.hand_rank for h in hands])
+        self.assertEqual(hand_rank[-1], evaluator.FLUSH)
+        # deuces are not in the short deck, cards can not repeat
+        for row in (['2S', '2H', 'AD', 'KC', 'QS', 'JH', '9D'],
+                ['AS', 'AS', 'KD', 'KC', 'QS', 'JH', '9D']):
+            ids = batch.numpy.array([[c.id for c in cards.Card.card_list(*row)]])
+            self.assertRaises(ValueError, batch.evaluate_batch, ids, short.evaluator)
+
+    def test_tables_follow_evaluator(self):
+        """Test a new evaluator does not get the tables of a freed one"""
+        rules = variants.short_deck
+        hand = cards.Card.card_list('AS', 'JS', '7S', '8S', '9S', 'KD', 'KH')
+        ids = batch.numpy.array([[c.id for c in hand]])
+        ev = evaluator.TableEvaluator(rules.ranks, rules.hand_order)
+        batch.evaluate_batch(ids, ev)
+        self.assertTrue(ev in batch._arrays)
+        count = len(batch._arrays)
+        del ev
+        self.assertEqual(len(batch._arrays), count - 1)
+        ev = evaluator.TableEvaluator(rules.ranks)
+        self.assertEqual(batch.evaluate_batch(ids, ev)[0][0], ev.evaluate(hand))
+
+class TestTexasGame(unittest.TestCase):
+    def test_fold_to_big_blind(self):
+        """Test blinds and everybody folding to the big blind"""
+        table = game.TexasGame([100, 100, 100], 1, 2, seed=1)
+        events = table.start_hand()
+        self.assertEqual(events[:2], [('blind', 1, 1), ('blind', 2, 2)])
+        self.assertEqual(events[-1], ('to_act', 0, 2, 4))
+        self.assertRaises(ValueError, table.act, 1, game.FOLD)
+        self.assertRaises(ValueError, table.act, 0, game.CHECK)
+        self.assertRaises(ValueError, table.act, 0, game.RAISE, 3)
+        table.act(0, game.FOLD)
+        events = table.act(1, game.FOLD)
+        self.assertEqual(events[-2:], [('win', 2, 3), ('hand_over',)])
+        self.assertEqual(table.stacks, [100, 99, 101])
+        self.assertEqual(table.button, 1)
+        self.assertFalse(table.in_progress)
+
+    def test_check_down(self):
+        """Test a hand checked down to showdown"""
+        table = game.TexasGame([50, 50], 1, 2, seed=2)
+        table.start_hand()
+        table.handle((0, game.CALL))
+        events = table.handle((1, game.CHECK))
+        self.assertEqual(events[-2][:2], ('street', game.FLOP))
+        for street in (game.FLOP, game.TURN, game.RIVER):
+            table.act(1, game.CHECK)
+            events = table.act(0, game.CHECK)
+        self.assertEqual(len(table.board), 5)
+        self.assertEqual(events[-1], ('hand_over',))
+        self.assertEqual(sum(table.stacks), 100)
+        winners = [e[1] for e in events if e[0] == 'win']
+        self.assertTrue(winners)
+
+    def test_side_pots(self):
+        """Test all-in players win only what they covered"""
+        for seed in xrange(20):
+            table = game.TexasGame([20, 50, 100], 1, 2, seed=seed)
+            table.start_hand()
+            table.act(0, game.RAISE, 20)
+            table.act(1, game.RAISE, 50)
+            events = table.act(2, game.CALL)
+            self.assertEqual(len(table.board), 5)
+            won = dict((e[1], e[2]) for e in events if e[0] == 'win')
+            self.assertEqual(sum(won.values()), 120)
+            self.assertTrue(won.get(0, 0) <= 60)
+            self.assertEqual(sum(table.stacks), 170)
+
+    def test_short_all_in_does_not_reopen(self):
+        """Test an incomplete all-in raise does not reopen raising"""
+        table = game.TexasGame([100, 100, 13], 1, 2, seed=1)
+        table.start_hand()
+        table.act(0, game.RAISE, 10)
+        table.act(1, game.CALL)
+        table.act(2, game.RAISE, 13)
+        self.assertRaises(ValueError, table.act, 0, game.RAISE, 30)
+        table.act(0, game.CALL)
+        events = table.act(1, game.CALL)
+        self.assertEqual(events[-2][:2], ('street', game.FLOP))
+
+    def test_short_big_blind(self):
+        """Test a short all-in big blind is called in full"""
+        table = game.TexasGame([100, 100, 1], 5, 10, seed=1)
+        events = table.start_hand()
+        self.assertEqual(events[1], ('blind', 2, 1))
+        self.assertEqual(events[-1], ('to_act', 0, 10, 20))
+        self.assertRaises(ValueError, table.act, 0, game.RAISE, 15)
+        table.act(0, game.CALL)
+        events = table.act(1, game.CALL)
+        self.assertEqual(events[-2][:2], ('street', game.FLOP))
+        self.assertEqual(table.contributed, [10, 10, 1])
+
+class TestShowdown(unittest.TestCase):
+    def test_side_pots(self):
+        """Test main and side pots going to different players"""
+        board = cards.Card.card_list('2C', '7D', '9H', 'JS', '4D')
+        holes = [cards.Card.card_list('AS', 'AH'), cards.Card.card_list('KS', 'KH'),
+                cards.Card.card_list('QS', 'QH'), None]
+        won, strengths = game.resolve_showdown(holes, board, [10, 30, 50, 5])
+        self.assertEqual(won, [35, 40, 20, 0])
+        self.assertEqual(strengths[3], 0)
+        self.assertTrue(strengths[0] > strengths[1] > strengths[2])
+
+    def test_odd_chip(self):
+        """Test odd chips go to the first winner after the button"""
+        board = cards.Card.card_list('AS', 'KS', 'QS', 'JS', 'TS')
+        holes = [cards.Card.card_list('2C', '3C'), cards.Card.card_list('2D', '3D'), None]
+        won, strengths = game.resolve_showdown(holes, board, [2, 2, 1], button=0)
+        self.assertEqual(won, [2, 3, 0])
+        won, strengths = game.resolve_showdown(holes, board, [2, 2, 1], button=1)
+        self.assertEqual(won, [3, 2, 0])
+
+class TestBench(unittest.TestCase):
+    def test_compare(self):
+        """Test benchmark results are compared to a baseline"""
+        current = bench.run(['card_sort', 'hand_memory_1m'], repeat=1)
+        rate = current['results']['card_sort']['value']
+        self.assertTrue(rate > 0)
+        baseline = json.loads(json.dumps(current))
+        baseline['results']['card_sort']['value'] = rate * 2
+        self.assertEqual(bench.compare(current, baseline), ['card_sort'])
+        baseline['results']['card_sort']['value'] = rate
+        self.assertEqual(bench.compare(current, baseline), [])
+
+    def test_import(self):
+        """Test importing cards builds no tables and is measured"""
+        script = ('import pokercards.cards, pokercards.evaluator as e\n'
+                'assert e.table_evaluator._nonflush is None\n')
+        env = dict(os.environ)
+        env.pop('POKERCARDS_TABLES', None)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(bench.__file__)))
+        self.assertEqual(subprocess.call([sys.executable, '-c', script], env=env), 0)
+        result = bench.run(['import_cards'], repeat=1)['results']['import_cards']
+        self.assertTrue(result['value'] > 0)
+        self.assertFalse(result['higher_is_better'])
+
 if __name__ == '__main__':
     setup_console_logging(level=INFO)
     suite = unittest.TestSuite()
     tl = unittest.TestLoader()
-    suite.addTests(map(tl.loadTestsFromTestCase, (TestCard, TestDeck, TestHand)))
+    suite.addTests(map(tl.loadTestsFromTestCase, (
+        TestCard,
+        TestCardSet,
+        TestDeck,
+        TestFastDeck,
+        TestSecure,
+        TestHand,
+        TestTableEvaluator,
+        TestIncremental,
+        TestOmaha,
+        TestLowball,
+        TestVariants,
+        TestRecords,
+        TestCache,
+        TestTrace,
+        TestEquity,
+        TestExactEquity,
+        TestIsomorphism,
+        TestRanges,
+        TestDatabase,
+        TestHistory,
+        TestBatch,
+        TestTexasGame,
+        TestShowdown,
+        TestBench,
+        )))
     unittest.TextTestRunner(verbosity=2).run(suite)
 